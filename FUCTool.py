@@ -1,17 +1,26 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import logging
+import multiprocessing
 import os
 import shutil
 import sys
 from pathlib import Path
 
 from PyQt5 import QtCore
+from PyQt5 import QtGui
 from PyQt5 import QtWidgets
 
+import patcher
+import profiling
 import utils
+from quest_index import QuestIndex
+from workers import Job
+from save_session import SaveSession
 from qt_ui import Ui_MainWindow
 
+LOG_PATH = Path("output.log")
+
 
 class QTextEditLogger(logging.Handler, QtCore.QObject):
     appendPlainText = QtCore.pyqtSignal(str)
@@ -30,123 +39,328 @@ class QTextEditLogger(logging.Handler, QtCore.QObject):
         self.appendPlainText.emit(msg)
 
 
-class ConfigWidget(QtWidgets.QWidget):
-    def __init__(self, desc, options, parent=None):
-        super(ConfigWidget, self).__init__(parent)
-        self.options = options
+class ConfigModel(QtCore.QAbstractListModel):
+    OptionsRole = QtCore.Qt.UserRole + 1
 
-        label = QtWidgets.QLabel(desc)
-        label.setOpenExternalLinks(True)
-        self.combobox = QtWidgets.QComboBox()
+    def __init__(self, entries, parent=None):
+        super(ConfigModel, self).__init__(parent)
+        self.entries = entries
+        self.values = [0] * len(entries)
 
-        for op in self.options["values"]:
-            self.combobox.addItem(op["label"])
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
 
-        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
-        self.combobox.setSizePolicy(sizePolicy)
-        label.setWordWrap(True)
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
 
-        layout = QtWidgets.QHBoxLayout()
-        layout.addWidget(label)
-        layout.addWidget(self.combobox)
+        itm = self.entries[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return itm["description"]
+        if role == QtCore.Qt.EditRole:
+            return self.values[index.row()]
+        if role == self.OptionsRole:
+            return [op["label"] for op in itm["options"]["values"]]
 
-        self.setLayout(layout)
+        return None
 
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or role != QtCore.Qt.EditRole:
+            return False
 
-class DumpDataBINThread(QtCore.QThread):
-    endSignal = QtCore.pyqtSignal(str)
-    statusSignal = QtCore.pyqtSignal(int)
+        self.values[index.row()] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
 
-    def __init__(self, filepath):
-        super().__init__()
-        self.filepath = filepath
+    def flags(self, index):
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsEditable
 
-    def run(self):
-        outfolder = Path(self.filepath).parent.joinpath("data_root")
+    def set_values(self, values):
+        self.values = list(values)
+        self.dataChanged.emit(self.index(0), self.index(len(self.values) - 1), [QtCore.Qt.EditRole])
+
+
+class ConfigDelegate(QtWidgets.QStyledItemDelegate):
+    MARGIN = 9
+
+    def __init__(self, view):
+        super(ConfigDelegate, self).__init__(view)
+        self.view = view
+        self.combo_sizes = {}
+        self.heights = {}
+
+        view.model().modelReset.connect(self.clear_cache)
+
+    def clear_cache(self):
+        self.combo_sizes.clear()
+        self.heights.clear()
+
+    def combo_size(self, index):
+        row = index.row()
+        if row not in self.combo_sizes:
+            fm = self.view.fontMetrics()
+            text_width = max(fm.horizontalAdvance(label) for label in index.data(ConfigModel.OptionsRole))
+
+            opt = QtWidgets.QStyleOptionComboBox()
+            opt.initFrom(self.view)
+            size = self.view.style().sizeFromContents(QtWidgets.QStyle.CT_ComboBox, opt,
+                                                      QtCore.QSize(text_width, fm.height()), self.view)
+            self.combo_sizes[row] = size
+
+        return self.combo_sizes[row]
+
+    def rects(self, rect, index):
+        combo = self.combo_size(index)
+        inner = rect.adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+
+        combo_rect = QtCore.QRect(0, 0, combo.width(), combo.height())
+        combo_rect.moveCenter(QtCore.QPoint(inner.right() - combo.width() // 2, inner.center().y()))
+        text_rect = QtCore.QRect(inner.left(), inner.top(), inner.width() - combo.width() - self.MARGIN,
+                                 inner.height())
+
+        return text_rect, combo_rect
+
+    def document(self, index, width):
+        doc = QtGui.QTextDocument()
+        doc.setDefaultFont(self.view.font())
+        doc.setDocumentMargin(0)
+
+        text = index.data(QtCore.Qt.DisplayRole)
+        if QtCore.Qt.mightBeRichText(text):
+            doc.setHtml(text)
+        else:
+            doc.setPlainText(text)
+
+        doc.setTextWidth(width)
+        return doc
+
+    def sizeHint(self, option, index):
+        width = self.view.viewport().width()
+        key = (index.row(), width)
+
+        if key not in self.heights:
+            text_rect, _ = self.rects(QtCore.QRect(0, 0, width, 0), index)
+            doc_height = int(self.document(index, text_rect.width()).size().height())
+            self.heights[key] = max(doc_height, self.combo_size(index).height()) + 2 * self.MARGIN
+
+        return QtCore.QSize(width, self.heights[key])
+
+    def paint(self, painter, option, index):
+        opt = QtWidgets.QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        opt.text = ""
+        style = self.view.style()
+        style.drawControl(QtWidgets.QStyle.CE_ItemViewItem, opt, painter, self.view)
+
+        text_rect, combo_rect = self.rects(option.rect, index)
+
+        painter.save()
+        painter.translate(text_rect.topLeft())
+        self.document(index, text_rect.width()).drawContents(painter)
+        painter.restore()
 
-        # Check if folder exists already, can cause issues later
-        if outfolder.exists():
-            shutil.rmtree(outfolder)
+        # Combobox look-alike, the real one is only created while editing
+        combo = QtWidgets.QStyleOptionComboBox()
+        combo.initFrom(self.view)
+        combo.rect = combo_rect
+        combo.state = option.state & QtWidgets.QStyle.State_Enabled
+        combo.currentText = index.data(ConfigModel.OptionsRole)[index.data(QtCore.Qt.EditRole)]
+        style.drawComplexControl(QtWidgets.QStyle.CC_ComboBox, combo, painter, self.view)
+        style.drawControl(QtWidgets.QStyle.CE_ComboBoxLabel, combo, painter, self.view)
 
-        os.makedirs(outfolder, exist_ok=True)
+    def editorEvent(self, event, model, option, index):
+        if event.type() != QtCore.QEvent.MouseButtonRelease or event.button() != QtCore.Qt.LeftButton:
+            return False
 
-        try:
-            utils.dump_data_bin(self.filepath, outfolder)
-            self.statusSignal.emit(1)
-        except (MemoryError, OverflowError):
-            self.statusSignal.emit(-1)
+        text_rect, combo_rect = self.rects(option.rect, index)
+        if combo_rect.contains(event.pos()):
+            self.view.edit(index)
+            return True
+
+        if text_rect.contains(event.pos()):
+            doc = self.document(index, text_rect.width())
+            anchor = doc.documentLayout().anchorAt(QtCore.QPointF(event.pos() - text_rect.topLeft()))
+            if anchor:
+                QtGui.QDesktopServices.openUrl(QtCore.QUrl(anchor))
+                return True
+
+        return False
+
+    def createEditor(self, parent, option, index):
+        editor = QtWidgets.QComboBox(parent)
+        editor.addItems(index.data(ConfigModel.OptionsRole))
+        editor.activated.connect(lambda: self.commit_and_close(editor))
+
+        QtCore.QTimer.singleShot(0, editor.showPopup)
+        return editor
+
+    def commit_and_close(self, editor):
+        self.commitData.emit(editor)
+        self.closeEditor.emit(editor, QtWidgets.QAbstractItemDelegate.NoHint)
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentIndex(index.data(QtCore.Qt.EditRole))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentIndex())
+
+    def updateEditorGeometry(self, editor, option, index):
+        _, combo_rect = self.rects(option.rect, index)
+        editor.setGeometry(combo_rect)
+
+
+class ReplaceModel(QtCore.QAbstractTableModel):
+    HEADERS = ["id", "path"]
+
+    def __init__(self, parent=None):
+        super(ReplaceModel, self).__init__(parent)
+        self.files = []
+        self.folders = {}  # folder to the files listed from it
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if index.isValid() and role == QtCore.Qt.DisplayRole:
+            return self.files[index.row()][self.HEADERS[index.column()]]
+
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+
+        return super(ReplaceModel, self).headerData(section, orientation, role)
+
+    def clear(self):
+        self.beginResetModel()
+        self.files = []
+        self.folders = {}
+        self.endResetModel()
+
+    def append_files(self, files):
+        if not files:
             return
 
-        utils.rename_dump_files(outfolder)
-        self.endSignal.emit(str(outfolder.absolute()))
+        start = len(self.files)
+        self.beginInsertRows(QtCore.QModelIndex(), start, start + len(files) - 1)
+        self.files.extend(files)
+        self.endInsertRows()
 
+        for f in files:
+            self.folders.setdefault(os.path.dirname(f["file"]), set()).add(f["file"])
 
-class ISOHashThread(QtCore.QThread):
-    endSignal = QtCore.pyqtSignal(str)
+    def files_in(self, folder):
+        return self.folders.get(folder, set())
 
-    def __init__(self, filepath):
-        super().__init__()
-        self.filepath = filepath
+    def files_below(self, folder):
+        prefix = os.path.join(folder, "")
+        return {f for d, files in self.folders.items() if d == folder or d.startswith(prefix) for f in files}
 
-    def run(self):
-        iso_hash = utils.get_iso_hash(self.filepath)
-        self.endSignal.emit(iso_hash)
+    def remove_files(self, paths):
+        if not paths:
+            return
 
+        # One pass, consecutive rows are removed together
+        row = len(self.files) - 1
+        while row >= 0:
+            if self.files[row]["file"] not in paths:
+                row -= 1
+                continue
 
-class CopyISOThread(QtCore.QThread):
-    endSignal = QtCore.pyqtSignal(str)
+            end = row
+            while row >= 0 and self.files[row]["file"] in paths:
+                row -= 1
 
-    def __init__(self, filepath):
-        super().__init__()
-        self.filepath = filepath
+            self.beginRemoveRows(QtCore.QModelIndex(), row + 1, end)
+            del self.files[row + 1:end + 1]
+            self.endRemoveRows()
+
+        for path in paths:
+            folder = os.path.dirname(path)
+            if folder in self.folders:
+                self.folders[folder].discard(path)
+                if not self.folders[folder]:
+                    del self.folders[folder]
+
+
+class ReplaceScanThread(QtCore.QThread):
+    batchSignal = QtCore.pyqtSignal(list)
+    endSignal = QtCore.pyqtSignal(int, list)
+
+    def __init__(self, folderpath, parent=None):
+        super().__init__(parent)
+        self.folderpath = folderpath
+        self.cancelled = False
 
     def run(self):
-        utils.create_temp_folder()
-        tmp_iso = Path(utils.temp_folder, self.filepath.name)
-        shutil.copy2(self.filepath, tmp_iso)
+        with profiling.stage("scan_mods_folder"):
+            self.scan()
 
-        self.endSignal.emit(str(tmp_iso))
+    def scan(self):
+        count = 0
+        for batch in utils.iter_replace_folder(self.folderpath):
+            if self.cancelled:
+                return
 
+            count += len(batch)
+            self.batchSignal.emit(batch)
 
-class ExtractDATABINThread(QtCore.QThread):
-    endSignal = QtCore.pyqtSignal(str)
+        # Folders to watch for changes
+        folders = []
+        for root, dirs, _ in os.walk(self.folderpath):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            folders.append(root)
 
-    def __init__(self, filepath):
-        super().__init__()
-        self.filepath = filepath
+        self.endSignal.emit(count, folders)
 
-    def run(self):
-        utils.create_temp_folder()
-        data_bin_path = utils.extract_data_bin(self.filepath)
-        self.endSignal.emit(data_bin_path)
 
+class FolderWatcher(QtCore.QObject):
+    changedSignal = QtCore.pyqtSignal(list)
 
-class DecryptDATABINThread(QtCore.QThread):
-    endSignal = QtCore.pyqtSignal(str)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pending = set()
 
-    def __init__(self, filepath):
-        super().__init__()
-        self.filepath = filepath
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.path_changed)
+        self.watcher.fileChanged.connect(self.path_changed)
 
-    def run(self):
-        utils.create_temp_folder()
-        data_dec_path = Path(utils.temp_folder, "DATA.BIN.DEC")
-        utils.decrypt_data_bin(self.filepath, data_dec_path)
+        # Editors and copies fire several events per file, report them together
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(300)
+        self.timer.timeout.connect(self.flush)
 
-        self.endSignal.emit(str(data_dec_path))
+    def watch(self, paths):
+        watched = self.watched()
+        paths = [str(p) for p in paths if str(p) not in watched]
+        if paths:
+            self.watcher.addPaths(paths)
 
+    def unwatch(self, paths):
+        paths = [str(p) for p in paths]
+        if paths:
+            self.watcher.removePaths(paths)
 
-class DecryptSaveThread(QtCore.QThread):
-    endSignal = QtCore.pyqtSignal(bytes)
+    def watched(self):
+        return set(self.watcher.directories() + self.watcher.files())
 
-    def __init__(self, filepath, save_region):
-        super().__init__()
-        self.filepath = filepath
-        self.save_region = save_region
+    def clear(self):
+        self.unwatch(self.watched())
+        self.pending.clear()
 
-    def run(self):
-        dec = utils.decrypt_save(self.filepath, self.save_region)
-        self.endSignal.emit(dec)
+    def path_changed(self, path):
+        self.pending.add(path)
+        self.timer.start()
+
+    def flush(self):
+        paths = sorted(self.pending)
+        self.pending.clear()
+        self.changedSignal.emit(paths)
 
 
 class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
@@ -155,26 +369,24 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.setupUi(self)
         self.setWindowTitle(f"FUComplete Tool [{utils.VERSION}]")
 
-        self.iso_hash_thread = None
-        self.copy_iso_thread = None
-        self.extract_databin_thread = None
-        self.decrypt_databin_thread = None
-        self.dump_thread = None
-        self.decrypt_save_thread = None
+        self.patch_job = None
+        self.dump_job = None
+        self.decrypt_save_job = None
+        self.decrypt_quests_job = None
+        self.replace_scan_thread = None
+
+        self.patching = False
 
-        self.process1 = None  # UMD-Replace.exe
-        self.process2 = None  # xdelta3.exe
         self.process3 = None  # SED-PC.exe
 
         self.iso_hash = None
-        self.current_iso_path = None
 
+        self.quest_index = QuestIndex(utils.quests_path, utils.quest_index_path)
         self.folder_quests = []
         self.save_quests = []
 
-        self.save = None
+        self.save_session = None
         self.save_key = None
-        self.save_region = None
 
         self.config = utils.config
 
@@ -188,21 +400,29 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         logging.getLogger().setLevel(logging.INFO)
         self.patcher_verticalLayout.insertWidget(3, logTextBox.widget)
 
+        # Hidden toggle to profile operations on user machines
+        self.profile_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Shift+P"), self)
+        self.profile_shortcut.activated.connect(self.toggle_profiling)
+
         # Patcher tab
+        self.patch_progress = QtWidgets.QProgressBar(self.verticalLayoutWidget)
+        self.patch_progress.setRange(0, 1000)
+        self.patch_progress.setValue(0)
+        self.patch_progress.setFormat("")
+        self.patcher_verticalLayout.insertWidget(4, self.patch_progress)
+
         self.psp_go_mem.clicked.connect(self.psp_go_check)
 
-        self.patch_button.clicked.connect(self.patch_iso)
+        self.patch_button.clicked.connect(self.patch_button_clicked)
         self.iso_button.clicked.connect(self.select_iso)
 
         # Config Tab
-        self.config_options = []
-        for itm in self.config["CONFIG.BIN"]:
-            item = QtWidgets.QListWidgetItem(self.config_list)
-            item_widget = ConfigWidget(itm["description"], itm["options"])
-            item.setSizeHint(item_widget.sizeHint())
-            self.config_list.addItem(item)
-            self.config_list.setItemWidget(item, item_widget)
-            self.config_options.append(item_widget)
+        self.config_model = ConfigModel(self.config["CONFIG.BIN"], self)
+        self.config_list.setModel(self.config_model)
+        self.config_list.setItemDelegate(ConfigDelegate(self.config_list))
+        self.config_list.setResizeMode(QtWidgets.QListView.Adjust)
+        self.config_list.setLayoutMode(QtWidgets.QListView.Batched)
+        self.config_list.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
 
         self.config_list.verticalScrollBar().setSingleStep(10)
 
@@ -210,9 +430,26 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.config_bin_button.clicked.connect(self.select_config_bin)
 
         # Replacer Tab
+        self.replace_model = ReplaceModel(self)
+        self.replace_proxy = QtCore.QSortFilterProxyModel(self)
+        self.replace_proxy.setSourceModel(self.replace_model)
+        self.replace_proxy.setFilterKeyColumn(-1)
+        self.replace_proxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.replace_list.setModel(self.replace_proxy)
+        self.replace_list.sortByColumn(0, QtCore.Qt.AscendingOrder)
+
+        self.replace_filter = QtWidgets.QLineEdit(self.verticalLayoutWidget_3)
+        self.replace_filter.setPlaceholderText("Filter...")
+        self.replace_filter.setClearButtonEnabled(True)
+        self.replace_filter.textChanged.connect(self.replace_proxy.setFilterFixedString)
+        self.horizontalLayout_6.insertWidget(1, self.replace_filter)
+
         self.replace_list.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)
         self.replace_list.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
 
+        self.mods_watcher = FolderWatcher(self)
+        self.mods_watcher.changedSignal.connect(self.mods_folder_changed)
+
         self.replace_folder_button.clicked.connect(self.select_replace_folder)
         self.refresh_replace_button.clicked.connect(self.refresh_list_clicked)
         self.nativepsp_button.clicked.connect(self.generate_nativepsp_folder)
@@ -233,10 +470,14 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.quests_save_table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.ResizeToContents)
         self.quests_save_table.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
 
+        self.quests_watcher = FolderWatcher(self)
+        self.quests_watcher.changedSignal.connect(self.scan_quests_folder)
+        os.makedirs(utils.quests_path, exist_ok=True)
+
         self.scan_quests_folder()
 
         self.save_folder_button.clicked.connect(self.select_save_folder)
-        self.quests_rescan.clicked.connect(self.scan_quests_folder)
+        self.quests_rescan.clicked.connect(self.rescan_quests_folder)
         self.quests_right.clicked.connect(self.copy_to_save)
         self.quests_left.clicked.connect(self.copy_from_save)
         self.quests_remove.clicked.connect(self.remove_from_save)
@@ -251,18 +492,16 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         if mode == 1:
             QtWidgets.QMessageBox.critical(self, title, text)
 
+    def toggle_profiling(self):
+        if profiling.enabled:
+            profiling.disable()
+        else:
+            profiling.enable(LOG_PATH.parent)
+
     def log_stderr(self, data):
         stderr = bytes(data).decode("utf8")
         logging.error(stderr)
 
-    def process1_stderr(self):
-        data = self.process1.readAllStandardError()
-        self.log_stderr(data)
-
-    def process2_stderr(self):
-        data = self.process2.readAllStandardError()
-        self.log_stderr(data)
-
     def process3_stderr(self):
         data = self.process3.readAllStandardError()
         self.log_stderr(data)
@@ -290,14 +529,23 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.iso_path.setText(fileName)
             logging.info("Checking ISO...")
 
-            self.iso_hash_thread = ISOHashThread(fileName)
-            self.iso_hash_thread.start()
+            self.iso_button.setEnabled(False)
+            self.patch_button.setEnabled(False)
+            self.patch_job = Job(utils.get_iso_hash, fileName)
+            self.patch_job.signals.progressSignal.connect(self.patch_job_progress)
+            self.patch_job.signals.endSignal.connect(self.iso_hash_finished)
+            self.patch_job.signals.errorSignal.connect(self.iso_hash_failed)
+            self.patch_job.start()
 
-            self.iso_hash_thread.endSignal.connect(self.iso_hash_finished)
+    def iso_hash_failed(self, error):
+        self.patch_progress_done()
+        self.iso_button.setEnabled(True)
+        logging.error(f"Couldn't read ISO: {error}")
 
     def iso_hash_finished(self, iso_hash):
         self.iso_hash = iso_hash
-        self.iso_hash_thread.exit()
+        self.iso_button.setEnabled(True)
+        self.patch_progress_done()
 
         if self.iso_hash in [utils.UMD_MD5HASH, utils.PSN_MD5HASH]:
             logging.info("Valid ISO file.")
@@ -307,226 +555,92 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             logging.error(f"UMD: {utils.UMD_MD5HASH}")
             logging.error(f"PSN: {utils.PSN_MD5HASH}")
 
-    def patch_compat(self, iso_path):
-        if utils.is_linux():
-            exe_path = Path(utils.bin_path, "xdelta3")
-        else:
-            exe_path = Path(utils.bin_path, "xdelta3.exe")
-        patch_path = Path(utils.current_path, "res", "patches", "compat.xdelta")
-        utils.create_temp_folder()
-        niso_path = Path(utils.temp_folder, iso_path.stem + "_compat.iso")
-        self.current_iso_path = niso_path
-
-        logging.info("UMD ISO found, applying compat patch...")
-        self.process2 = QtCore.QProcess()
-        self.process2.readyReadStandardError.connect(self.process2_stderr)
-        self.process2.finished.connect(self.patch_compat_finished)
-        self.process2.start(str(exe_path), ["-d", "-s", str(iso_path), str(patch_path), str(niso_path)])
-
-    def patch_compat_finished(self):
-        logging.info("Compat patching done.")
-        self.process2 = None
-
-        self.extract_databin()
-
-    def copy_iso(self, iso_path):
-        logging.info("Copying ISO...")
-        self.copy_iso_thread = CopyISOThread(iso_path)
-        self.copy_iso_thread.start()
-
-        self.copy_iso_thread.endSignal.connect(self.copy_iso_finished)
-
-    def copy_iso_finished(self, tmp_iso):
-        self.copy_iso_thread.exit()
-
-        self.current_iso_path = Path(tmp_iso)
-        self.extract_databin()
-
-    def extract_databin(self):
-        logging.info("Extracting DATA.BIN...")
-        self.extract_databin_thread = ExtractDATABINThread(self.current_iso_path)
-        self.extract_databin_thread.start()
-
-        self.extract_databin_thread.endSignal.connect(self.extract_databin_finished)
-
-    def extract_databin_finished(self, databin_path):
-        self.extract_databin_thread.exit()
-        self.decrypt_databin(databin_path)
-
-    def extract_patched_databin(self):
-        logging.info("Extracting patched DATA.BIN...")
-        self.extract_databin_thread = ExtractDATABINThread(self.current_iso_path)
-        self.extract_databin_thread.start()
-
-        self.extract_databin_thread.endSignal.connect(self.extract_patched_databin_finished)
-
-    def extract_patched_databin_finished(self):
-        self.extract_databin_thread.exit()
-
-        data_bin_path = Path(utils.temp_folder, "DATA.BIN")
-        ndatabin = Path(self.iso_path.text()).parent.joinpath("DATA.BIN")
-
-        shutil.move(data_bin_path, ndatabin)
-        logging.info(f"DATA.BIN moved to: {ndatabin}")
-
-        self.cleanup()
-
-    def decrypt_databin(self, databin_path):
-        logging.info("Decrypting DATA.BIN (this may take a few minutes)...")
-        self.decrypt_databin_thread = DecryptDATABINThread(databin_path)
-        self.decrypt_databin_thread.start()
-
-        self.decrypt_databin_thread.endSignal.connect(self.decrypt_databin_finished)
-
-    def decrypt_databin_finished(self):
-        self.decrypt_databin_thread.exit()
-
-        old_data_path = Path(utils.temp_folder, "DATA.BIN")
-        os.remove(old_data_path)
-
-        self.replace_databin()
-
-    def replace_databin(self):
-        if utils.is_linux():
-            exe_path = Path(utils.bin_path, "UMD-replace")
-        else:
-            exe_path = Path(utils.bin_path, "UMD-replace.exe")
-        databin_path = Path(utils.temp_folder, "DATA.BIN.DEC")
-
-        logging.info("Replacing DATA.BIN...")
-        self.process1 = QtCore.QProcess()
-        self.process1.readyReadStandardError.connect(self.process1_stderr)
-        self.process1.finished.connect(self.replace_databin_finished)
-        self.process1.start(str(exe_path), [str(self.current_iso_path), "/PSP_GAME/USRDIR/DATA.BIN", str(databin_path)])
-
-    def replace_databin_finished(self):
-        self.process1 = None
-
-        dec_data_path = Path(utils.temp_folder, "DATA.BIN.DEC")
-        os.remove(dec_data_path)
-
-        self.patch_fuc()
-
-    def patch_fuc(self):
-        if utils.is_linux():
-            exe_path = Path(utils.bin_path, "xdelta3")
-        else:
-            exe_path = Path(utils.bin_path, "xdelta3.exe")
-        patch_path = Path(utils.current_path, "res", "patches", "FUC.xdelta")
-        niso_path = Path(utils.temp_folder, self.current_iso_path.stem + "_FUC.iso")
-
-        logging.info("Patching ISO...")
-        self.process2 = QtCore.QProcess()
-        self.process2.readyReadStandardError.connect(self.process2_stderr)
-        self.process2.finished.connect(self.patch_fuc_finished)
-        self.process2.start(str(exe_path), ["-d", "-s", str(self.current_iso_path), str(patch_path), str(niso_path)])
-
-    def patch_fuc_finished(self):
-        self.process2 = None
-
-        iso_path = Path(self.iso_path.text())
-        self.current_iso_path = Path(utils.temp_folder, self.current_iso_path.stem + "_FUC.iso")
-
-        if self.psp_go_mem.isChecked():
-            self.patch_psp_go()
-        else:
-            niso_path = Path(iso_path.parent, iso_path.stem + "_FUC.iso")
-            shutil.move(self.current_iso_path, niso_path)
-
-            self.current_iso_path = niso_path
-
-            if self.keep_databin.isChecked():
-                self.extract_patched_databin()
-            else:
-                self.cleanup()
-
-    def patch_psp_go(self):
-        if utils.is_linux():
-            exe_path = Path(utils.bin_path, "xdelta3")
+    def start_patch_job(self, job, finished):
+        self.patch_job = job
+        job.signals.progressSignal.connect(self.patch_job_progress)
+        job.signals.endSignal.connect(finished)
+        job.signals.errorSignal.connect(self.patch_failed)
+        job.signals.cancelSignal.connect(self.patch_aborted)
+        job.start()
+
+    def patch_job_progress(self, done, total, text):
+        self.set_patch_progress(done, total, text)
+
+    def set_patch_progress(self, done, total, text):
+        if total > 0:
+            self.patch_progress.setRange(0, 1000)
+            self.patch_progress.setValue(min(done * 1000 // total, 1000))
         else:
-            exe_path = Path(utils.bin_path, "xdelta3.exe")
-        patch_path = Path(utils.current_path, "res", "patches", "EF0.xdelta")
+            self.patch_progress.setRange(0, 0)
 
-        # Remove the first ISO, not needed at this point
-        iso_path = Path(self.iso_path.text())
-        tmp_iso = Path(utils.temp_folder, iso_path.name)
+        self.patch_progress.setFormat(text)
 
-        if not tmp_iso.exists():
-            tmp_iso = Path(utils.temp_folder, iso_path.stem + "_compat.iso")
+    def patch_progress_done(self):
+        self.patch_job = None
+        self.patch_progress.setRange(0, 1000)
+        self.patch_progress.setValue(0)
+        self.patch_progress.setFormat("")
 
-        os.remove(tmp_iso)
-
-        niso_path = Path(utils.temp_folder, self.current_iso_path.stem + "_ef0.iso")
-
-        logging.info("Applying PSP Go internal storage patch...")
-        self.process2 = QtCore.QProcess()
-        self.process2.readyReadStandardError.connect(self.process2_stderr)
-        self.process2.finished.connect(self.patch_psp_go_finished)
-        self.process2.start(str(exe_path), ["-d", "-s", str(self.current_iso_path), str(patch_path), str(niso_path)])
-
-    def patch_psp_go_finished(self):
-        logging.info("PSP Go internal storage patching done.")
-        self.process2 = None
-
-        iso_path = Path(self.iso_path.text())
-        self.current_iso_path = Path(utils.temp_folder, self.current_iso_path.stem + "_ef0.iso")
-        niso_path = Path(iso_path.parent, iso_path.stem + "_FUC_ef0.iso")
-        shutil.move(self.current_iso_path, niso_path)
-
-        self.current_iso_path = niso_path
-
-        if self.keep_databin.isChecked():
-            self.extract_patched_databin()
+    def patch_button_clicked(self):
+        if self.patching:
+            self.cancel_patch()
         else:
-            self.cleanup()
+            self.patch_iso()
 
-    def cleanup(self):
-        if utils.temp_folder.exists():
-            shutil.rmtree(utils.temp_folder)
-
-        logging.info("Checking patched ISO...")
-        self.iso_hash_thread = ISOHashThread(self.current_iso_path)
-        self.iso_hash_thread.start()
+    def cancel_patch(self):
+        logging.info("Cancelling...")
+        self.patch_button.setEnabled(False)
 
-        self.iso_hash_thread.endSignal.connect(self.iso_hash_finished2)
+        # The job reports back through patch_aborted
+        if self.patch_job is not None:
+            self.patch_job.cancel()
 
-    def iso_hash_finished2(self, iso_hash):
-        self.iso_hash = iso_hash
-        self.iso_hash_thread.exit()
+    def patch_aborted(self):
+        self.patch_progress_done()
+        logging.info("Patching cancelled.")
+        self.patch_reset()
 
-        if self.iso_hash in self.config["iso_checksum"]:
-            logging.info(f"Patching done, patched ISO is located at: {self.current_iso_path}")
-        else:
-            logging.error(f"Patched ISO doesn't match the checksum, try again.")
+    def patch_failed(self, error):
+        self.patch_progress_done()
+        logging.error(f"Patching failed: {error}")
+        self.patch_reset()
 
+    def patch_reset(self):
+        self.patching = False
         self.patch_button.setEnabled(True)
         self.iso_button.setEnabled(True)
         self.keep_databin.setEnabled(True)
         self.psp_go_mem.setEnabled(True)
         self.patch_button.setText("Patch ISO")
-        self.current_iso_path = None
+
+    def patch_finished(self, res):
+        out_path, valid = res
+        self.patch_progress_done()
+
+        if valid:
+            logging.info(f"Patching done, patched ISO is located at: {out_path}")
+        else:
+            logging.error(f"Patched ISO doesn't match the checksum, try again.")
+
+        self.patch_reset()
 
     def patch_iso(self):
-        self.patch_button.setEnabled(False)
+        self.patching = True
         self.iso_button.setEnabled(False)
         self.keep_databin.setEnabled(False)
         self.psp_go_mem.setEnabled(False)
-        self.patch_button.setText("Patching...")
-
-        iso_path = Path(self.iso_path.text())
+        self.patch_button.setText("Cancel")
 
-        if self.iso_hash == utils.UMD_MD5HASH:
-            self.patch_compat(iso_path)
-        else:
-            self.copy_iso(iso_path)
+        job = Job(patcher.run_patch, self.iso_path.text(), self.iso_hash,
+                  psp_go=self.psp_go_mem.isChecked(), keep_databin=self.keep_databin.isChecked())
+        self.start_patch_job(job, self.patch_finished)
 
     def select_config_bin(self):
         options = QtWidgets.QFileDialog.Options()
         fileName, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select CONFIG.BIN file", "",
                                                             "CONFIG.BIN (CONFIG.BIN)", options=options)
         if fileName:
-            for i, conf in enumerate(utils.read_configs(fileName)):
-                self.config_options[i].combobox.setCurrentIndex(conf)
+            self.config_model.set_values(utils.read_configs(fileName))
 
             self.config_bin_path.setText(fileName)
             self.config_list.setEnabled(True)
@@ -536,37 +650,92 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         cpath = self.config_bin_path.text()
         config_bin = utils.read_file_bytes(cpath)
 
-        for itm in self.config_options:
-            offset = itm.options["offset"]
-            data = itm.options["values"][itm.combobox.currentIndex()]["data"]
-            config_bin = utils.write_config(config_bin, offset, data)
+        config_bin = utils.write_configs(config_bin, self.config_model.values)
 
         utils.write_file_bytes(cpath, config_bin)
         self.generic_dialog("Configuration saved successfully.")
 
     def refresh_replace_list(self, folderName):
-        self.replace_list.clearContents()
-        self.replace_list.setRowCount(0)
-        self.replace_status.clear()
+        if self.replace_scan_thread is not None:
+            self.replace_scan_thread.cancelled = True
+
+        self.replace_model.clear()
+        self.replace_status.setText("Scanning...")
+
+        # Parented so a cancelled scan can finish after it's replaced
+        self.replace_scan_thread = ReplaceScanThread(folderName, self)
+        self.replace_scan_thread.finished.connect(self.replace_scan_thread.deleteLater)
+        self.replace_scan_thread.batchSignal.connect(self.replace_scan_batch)
+        self.replace_scan_thread.endSignal.connect(self.replace_scan_finished)
+        self.replace_scan_thread.start()
+
+    def replace_scan_batch(self, files):
+        # Ignore batches from a scan that was replaced by a newer one
+        if self.sender() is not self.replace_scan_thread:
+            return
 
-        files = utils.read_replace_folder(folderName)
+        self.replace_model.append_files(files)
+        self.replace_status.setText(f"Scanning... {self.replace_model.rowCount()} file(s) found.")
 
-        if not files:
+    def replace_scan_finished(self, count, folders):
+        if self.sender() is not self.replace_scan_thread:
+            return
+
+        self.replace_scan_thread = None
+        self.replace_status.setText(f"{count} file(s) found." if count else "")
+
+        self.mods_watcher.clear()
+        self.mods_watcher.watch(folders)
+
+        if not count:
             mods_path = Path(utils.current_path, "mods")
             if Path(self.replace_path.text()) != mods_path:
                 self.generic_dialog("ERROR: No files found in folder.", mode=1, title="Error")
 
+    def mods_folder_changed(self, paths):
+        # A full scan is running, it will pick the changes up
+        if self.replace_scan_thread is not None:
             return
 
-        lenght = len(files)
-        self.replace_list.setRowCount(lenght)
-        self.replace_status.setText(f"{lenght} file(s) found.")
+        watched = self.mods_watcher.watched()
+        prefixes = tuple(os.path.join(p, "") for p in paths)
+        removed = set()
+
+        # Removed folders, including ones below a folder that changed
+        gone = [f for f in watched if (f in paths or f.startswith(prefixes)) and not os.path.isdir(f)]
+        for folder in gone:
+            removed |= self.replace_model.files_below(folder)
+        self.mods_watcher.unwatch(gone)
+
+        new_files = []
+        new_folders = []
+        for folder in paths:
+            if not os.path.isdir(folder):
+                continue
+
+            with os.scandir(folder) as it:
+                entries = list(it)
 
-        for i, f in enumerate(files):
-            idx = QtWidgets.QTableWidgetItem(f["id"])
-            path = QtWidgets.QTableWidgetItem(f["path"])
-            self.replace_list.setItem(i, 0, idx)
-            self.replace_list.setItem(i, 1, path)
+            files = {e.path for e in entries if e.is_file() and utils.is_mod_file(e.name)}
+            known = self.replace_model.files_in(folder)
+
+            removed |= known - files
+            new_files.extend(utils.get_replace_entry(f) for f in sorted(files - known))
+
+            for e in entries:
+                if e.is_dir() and not e.name.startswith(".") and e.path not in watched:
+                    new_files.extend(utils.get_replace_entry(f) for f in utils.iter_all_files(e.path))
+
+                    for root, dirs, _ in os.walk(e.path):
+                        dirs[:] = [d for d in dirs if not d.startswith(".")]
+                        new_folders.append(root)
+
+        self.replace_model.remove_files(removed)
+        self.replace_model.append_files([f for f in new_files if f is not None])
+        self.mods_watcher.watch(new_folders)
+
+        count = self.replace_model.rowCount()
+        self.replace_status.setText(f"{count} file(s) found." if count else "")
 
     def refresh_list_clicked(self):
         path = self.replace_path.text()
@@ -599,31 +768,52 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.dump_databin_button.setEnabled(False)
             self.dump_databin_button.setText("Dumping...")
 
-            self.dump_thread = DumpDataBINThread(fileName)
-            self.dump_thread.start()
+            self.dump_job = Job(utils.dump_data_bin_folder, fileName)
+            self.dump_job.unit = "files"
+            self.dump_job.signals.progressSignal.connect(self.dump_progress)
+            self.dump_job.signals.endSignal.connect(self.dump_finished)
+            self.dump_job.signals.errorSignal.connect(self.dump_failed)
+            self.dump_job.start()
+
+    def dump_progress(self, done, total, text):
+        self.dump_databin_button.setText(f"Dumping... {text}")
 
-            self.dump_thread.endSignal.connect(self.dump_finished)
-            self.dump_thread.statusSignal.connect(self.dump_status)
+    def dump_reset(self):
+        self.dump_job = None
+        self.dump_databin_button.setText("Dump DATA.BIN")
+        self.dump_databin_button.setEnabled(True)
+
+    def dump_failed(self, error):
+        self.dump_reset()
 
-    def dump_status(self, code):
-        if code == -1:
-            self.dump_databin_button.setText("Dump DATA.BIN")
-            self.dump_databin_button.setEnabled(True)
+        if isinstance(error, (MemoryError, OverflowError)):
             self.generic_dialog(f"DATA.BIN is not decrypted.", mode=1, title="Error")
-            self.dump_thread.exit()
-        if code == 1:
-            self.dump_databin_button.setText("Renaming...")
+        else:
+            self.generic_dialog(f"Couldn't dump DATA.BIN: {error}", mode=1, title="Error")
 
     def dump_finished(self, filepath):
-        self.dump_databin_button.setEnabled(True)
-        self.dump_databin_button.setText("Dump DATA.BIN")
-
+        self.dump_reset()
         self.generic_dialog(f"DATA.BIN dumped to {filepath}")
-        self.dump_thread.exit()
 
     def scan_quests_folder(self):
         self.quests_save_table.clearSelection()
-        self.folder_quests = utils.get_quests_in_folder()
+        self.folder_quests = self.quest_index.scan()
+
+        encrypted = self.quest_index.get_undecrypted()
+        if encrypted and self.decrypt_quests_job is None:
+            logging.info(f"Decrypting {len(encrypted)} quest(s)...")
+            self.decrypt_quests_job = Job(utils.decrypt_quest_files, encrypted)
+            self.decrypt_quests_job.signals.endSignal.connect(self.decrypt_quests_finished)
+            self.decrypt_quests_job.signals.errorSignal.connect(self.decrypt_quests_failed)
+            self.decrypt_quests_job.start()
+
+        # The folder reports added and removed quests, quests overwritten in
+        # place only show up on their own watch. Only the difference is applied
+        paths = {str(utils.quests_path)} | set(self.quest_index.get_paths())
+        watched = self.quests_watcher.watched()
+        self.quests_watcher.unwatch(watched - paths)
+        self.quests_watcher.watch(paths - watched)
+
         qsize = len(self.folder_quests)
 
         self.quests_folder_table.setRowCount(qsize)
@@ -635,6 +825,32 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.quests_folder_table.setItem(i, 0, qid)
             self.quests_folder_table.setItem(i, 1, name)
 
+    def decrypt_quests_finished(self, res):
+        failed = [path for path, dec in zip(self.decrypt_quests_job.args[0], res) if dec is None]
+        self.decrypt_quests_job = None
+
+        for path in failed:
+            logging.warning(f"Couldn't decrypt quest: {Path(path).name}")
+
+        self.quest_index.mark_decrypt_failed(failed)
+        self.scan_quests_folder()
+
+    def decrypt_quests_failed(self, error):
+        self.decrypt_quests_job = None
+        logging.error(f"Couldn't decrypt quests: {error}")
+
+    def rescan_quests_folder(self):
+        self.scan_quests_folder()
+
+        saved = self.quest_index.dedupe()
+        if saved:
+            logging.info(f"Hardlinked duplicate quests, saved {saved} bytes.")
+
+        collisions = self.quest_index.get_collisions()
+        for qid, paths in collisions.items():
+            names = ", ".join(Path(p).name for p in paths)
+            logging.warning(f"Different quests share qid {qid}: {names}")
+
     def scan_quests_save(self):
         self.quests_save_table.clearContents()
         qsize = len(self.save_quests)
@@ -662,15 +878,16 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
             self.quests_save_button.setEnabled(True)
 
     def read_save(self, path):
+        save_region = None
         if "ULES01213" in path.parent.name:
             self.save_key = "FU.bin"
-            self.save_region = 1
+            save_region = 1
         if "ULUS10391" in path.parent.name:
             self.save_key = "FU.bin"
-            self.save_region = 2
+            save_region = 2
         if "ULJM05500" in path.parent.name:
             self.save_key = "P2G.bin"
-            self.save_region = 3
+            save_region = 3
 
         param = Path(path.parent, "PARAM.SFO")
         if (self.save_key is None) or (not path.exists()) or (not param.exists()):
@@ -680,14 +897,23 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
 
         self.save_folder_button.setEnabled(False)
         self.save_folder_button.setText("Decrypting...")
-        self.decrypt_save_thread = DecryptSaveThread(path, self.save_region)
-        self.decrypt_save_thread.start()
+        self.save_session = SaveSession(path, save_region)
+        self.decrypt_save_job = Job(self.save_session.load)
+        self.decrypt_save_job.signals.endSignal.connect(self.decrypt_save_finished)
+        self.decrypt_save_job.signals.errorSignal.connect(self.decrypt_save_failed)
+        self.decrypt_save_job.start()
+
+    def decrypt_save_failed(self, error):
+        self.decrypt_save_job = None
+        self.save_session = None
 
-        self.decrypt_save_thread.endSignal.connect(self.decrypt_save_finished)
+        self.save_folder_button.setEnabled(True)
+        self.save_folder_button.setText("Select")
+        self.generic_dialog(f"Couldn't decrypt save: {error}", mode=1, title="Error")
 
-    def decrypt_save_finished(self, dec):
-        self.save = bytearray(dec)
-        self.save_quests = utils.get_quests_in_save(dec)
+    def decrypt_save_finished(self):
+        self.decrypt_save_job = None
+        self.save_quests = self.save_session.get_quests()
         self.scan_quests_save()
 
         self.quests_save_button.setEnabled(True)
@@ -702,41 +928,56 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         if len(self.save_quests) + len(selection) > 18:
             self.generic_dialog("Not enough slots to add selected quests to save.", mode=1, title="Error")
         else:
+            new_quests = []
             for s in selection:
-                qfile = self.folder_quests[s.row()]
-                self.save_quests.append(qfile)
-
+                qfile = dict(self.folder_quests[s.row()])
+                try:
+                    qfile["bytes"] = utils.read_quest_file(qfile["path"])
+                except OSError as e:
+                    # Moved or deleted since the last scan
+                    self.generic_dialog(f"Couldn't read quest: {e}", mode=1, title="Error")
+                    self.scan_quests_folder()
+                    return
+
+                new_quests.append(qfile)
+
+            self.save_quests.extend(new_quests)
             self.quests_folder_table.clearSelection()
             self.scan_quests_save()
 
     def copy_from_save(self):
         selection = self.quests_save_table.selectionModel().selectedRows()
 
+        qfolder = utils.quests_path
+        if not qfolder.exists():
+            os.makedirs(qfolder)
+
+        new_quests = []
         for s in selection:
             qfile = self.save_quests[s.row()]
-            self.folder_quests.append(qfile)
-
-            fname = "m" + qfile["qid"] + ".mib.dec"
-            qfolder = Path(utils.current_path, "quests")
-            fpath = Path(qfolder, fname)
-
-            if not qfolder.exists():
-                os.makedirs(qfolder)
-
-            if fpath.exists():
-                dlg = QtWidgets.QMessageBox()
-                dlg.setWindowTitle("Question")
-                dlg.setText(f"{fname} already exists, overwrite?")
-                dlg.setIcon(QtWidgets.QMessageBox.Icon.Question)
-                dlg.setStandardButtons(
-                    QtWidgets.QMessageBox.StandardButton.Yes | QtWidgets.QMessageBox.StandardButton.No)
-
-                if dlg.exec() == QtWidgets.QMessageBox.StandardButton.Yes:
-                    with open(fpath, "wb") as f:
-                        f.write(qfile["bytes"])
-            else:
-                with open(fpath, "wb") as f:
-                    f.write(qfile["bytes"])
+
+            # Already backed up, nothing to write
+            if self.quest_index.find_quest(qfile["qid"], qfile["bytes"]):
+                continue
+
+            fpath = Path(qfolder, "m" + qfile["qid"] + ".mib.dec")
+            new_quests.append((fpath, qfile))
+
+        existing = [fpath.name for fpath, _ in new_quests if fpath.exists()]
+        if existing:
+            dlg = QtWidgets.QMessageBox()
+            dlg.setWindowTitle("Question")
+            dlg.setText(f"{len(existing)} quest(s) already exist, overwrite?")
+            dlg.setDetailedText("\n".join(existing))
+            dlg.setIcon(QtWidgets.QMessageBox.Icon.Question)
+            dlg.setStandardButtons(
+                QtWidgets.QMessageBox.StandardButton.Yes | QtWidgets.QMessageBox.StandardButton.No)
+
+            if dlg.exec() != QtWidgets.QMessageBox.StandardButton.Yes:
+                new_quests = [(fpath, qfile) for fpath, qfile in new_quests if fpath.name not in existing]
+
+        for fpath, qfile in new_quests:
+            utils.replace_file_bytes(fpath, qfile["bytes"])
 
         self.scan_quests_folder()
 
@@ -760,12 +1001,8 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.quests_save_button.setText("Encrypting...")
         self.quests_save_button.setEnabled(False)
 
-        empty = 18 - len(self.save_quests)
-        empty_quests = [{"bytes": bytearray(), "qid": "", "name": ""} for _ in range(empty)]
-
-        nquests = self.save_quests + empty_quests
-        nsave = utils.add_quests_to_save(self.save, nquests)
-        nsave = utils.encrypt_save(nsave, self.save_region)
+        self.save_session.set_quests(self.save_quests)
+        nsave = self.save_session.encrypt()
 
         utils.create_temp_folder()
         og_save = Path(self.save_path.text(), "MHP2NDG.BIN")
@@ -790,16 +1027,29 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         self.process3.finished.connect(self.encrypt_finished)
         self.process3.start(str(exe_path), ["-e", str(tmp_save), str(param_in), str(og_save), str(keypath)])
 
-    def encrypt_finished(self):
+    def encrypt_finished(self, exit_code, exit_status):
         self.process3 = None
 
         tmp_save = Path(utils.temp_folder, "MHP2NDG.BIN.TEMP")
         os.remove(tmp_save)
 
+        self.quests_save_button.setEnabled(True)
+        self.quests_save_button.setText("Save")
+
+        if exit_status != QtCore.QProcess.NormalExit or exit_code != 0:
+            # The session no longer matches the file, put the backup back and read it again
+            og_save = Path(self.save_path.text(), "MHP2NDG.BIN")
+            shutil.copy2(Path(og_save.parent, "MHP2NDG.BIN.BAK"), og_save)
+
+            self.generic_dialog(f"Couldn't write save, SED-PC exited with {exit_code}.", mode=1, title="Error")
+            self.read_save(og_save)
+            return
+
         self.generic_dialog(f"Save changed succesfully.")
 
-        save_path = Path(self.save_path.text()).joinpath("MHP2NDG.BIN")
-        self.read_save(save_path)
+        # The session already holds what was written, no need to decrypt it again
+        self.save_quests = self.save_session.get_quests()
+        self.scan_quests_save()
 
 
 def exception_hook(exc_type, exc_value, exc_traceback):
@@ -808,11 +1058,22 @@ def exception_hook(exc_type, exc_value, exc_traceback):
 
 
 if __name__ == "__main__":
-    logging.basicConfig(filename="output.log", filemode="w+")
+    multiprocessing.freeze_support()
+
+    # Headless mode
+    args = [a for a in sys.argv[1:] if a != "--profile"]
+    if args:
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
+    logging.basicConfig(filename=LOG_PATH, filemode="w+")
     sys.excepthook = exception_hook
 
     app = QtWidgets.QApplication(sys.argv)
     window = MainWindow()
+
+    # Once the log box is there, so the message shows up in it
+    if len(args) < len(sys.argv) - 1:
+        profiling.enable(LOG_PATH.parent)
     app.setStyle("Fusion")
     window.show()
     app.exec_()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import pytest
+
+import utils
+from fixtures import make_config_entries, write_random_file
+
+COUNTS = [10, 100, 1000]
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def bench_read_configs(benchmark, tmp_path, monkeypatch, count):
+    monkeypatch.setattr(utils, "config_schema", utils.compile_config_schema(make_config_entries(count)))
+    config_path = write_random_file(Path(tmp_path, "CONFIG.BIN"), count * 4 + 0x10)
+
+    benchmark(utils.read_configs, config_path)
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def bench_write_configs(benchmark, count):
+    schema = utils.compile_config_schema(make_config_entries(count))
+    selections = [len(op.values) - 1 for op in schema]
+    benchmark(utils.write_configs, bytearray(count * 4), selections, schema)
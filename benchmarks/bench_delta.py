@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import shutil
+from pathlib import Path
+
+import pytest
+
+import utils
+from fixtures import mutate_file
+
+needs_xdelta = pytest.mark.skipif(not utils.get_exe_path("xdelta3").exists(), reason="needs xdelta3 in bin")
+
+
+@pytest.fixture(scope="module")
+def delta_mods(tmp_path_factory, mods):
+    # Game files and mods that only change part of them
+    folder = tmp_path_factory.mktemp("delta")
+    base = Path(folder, "data_root")
+    shutil.copytree(mods, base)
+
+    changed = Path(folder, "mods")
+    for f in utils.iter_all_files(base):
+        dest = Path(changed, Path(f).relative_to(base))
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        mutate_file(f, dest)
+
+    return base, changed
+
+
+@needs_xdelta
+def bench_build_delta_pack(benchmark, tmp_path, delta_mods):
+    base, changed = delta_mods
+    benchmark.pedantic(utils.build_mod_pack, args=(changed, Path(tmp_path, "delta.fucpack")),
+                       kwargs={"base": base}, rounds=1)
+
+
+@needs_xdelta
+def bench_generate_filebin_delta(benchmark, tmp_path, delta_mods):
+    base, changed = delta_mods
+    pack = Path(tmp_path, "delta.fucpack")
+    utils.build_mod_pack(changed, pack, base=base)
+
+    benchmark.pedantic(utils.generate_filebin, args=(pack, Path(tmp_path, "NATIVEPSP"), base), rounds=1)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import itertools
+import shutil
+from pathlib import Path
+
+import pytest
+
+import utils
+from fixtures import make_files_folder
+
+COUNTS = [10, 100, 1000]
+FILE_SIZE = 16 * 1024
+
+
+def get_filelist_entries(count):
+    # Files without an extension are skipped when reading a mods folder
+    entries = (v for v in utils.filelist["ids"].items() if utils.is_mod_file(Path(v[1]).name))
+    return list(itertools.islice(entries, count))
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def bench_generate_filebin(benchmark, tmp_path, count):
+    infolder = make_files_folder(Path(tmp_path, "mods"), [path for _, path in get_filelist_entries(count)],
+                                 FILE_SIZE)
+    outfolder = Path(tmp_path, "NATIVEPSP")
+
+    benchmark(utils.generate_filebin, infolder, outfolder)
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def bench_rename_dump_files(benchmark, tmp_path, count):
+    names = [idx for idx, _ in get_filelist_entries(count)]
+    template = make_files_folder(Path(tmp_path, "dump"), names, FILE_SIZE)
+
+    # Files are moved, every round starts from a fresh dump
+    def setup():
+        outfolder = Path(tmp_path, "data_root")
+        shutil.rmtree(outfolder, ignore_errors=True)
+        shutil.copytree(template, outfolder)
+        return (outfolder,), {}
+
+    benchmark.pedantic(utils.rename_dump_files, setup=setup, rounds=5)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import pytest
+
+import utils
+from fixtures import SIZES_MB
+
+
+@pytest.mark.parametrize("size", SIZES_MB)
+def bench_get_iso_hash(benchmark, isos, size):
+    benchmark(utils.get_iso_hash, isos[size])
+
+
+@pytest.mark.parametrize("size", SIZES_MB)
+def bench_extract_data_bin(benchmark, isos, size):
+    benchmark(utils.extract_data_bin, isos[size])
+
+
+@pytest.mark.parametrize("size", SIZES_MB)
+def bench_decrypt_data_bin(benchmark, data_bins, temp_folder, size):
+    outpath = Path(temp_folder, "DATA.BIN.DEC")
+    benchmark.pedantic(utils.decrypt_data_bin, args=(data_bins[size], outpath), rounds=3)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from bench_files import get_filelist_entries
+from fixtures import MB, make_files_folder, make_iso, write_random_file
+
+pytest.importorskip("resource")
+
+ROOT = str(Path(__file__).parent.parent)
+BUDGET = 64 * MB
+LARGE_SIZE = 4 * BUDGET
+
+
+def get_peak_rss_growth(code, temp_folder):
+    # Peak RSS is per process, every check runs in a fresh interpreter
+    script = "\n".join([
+        "import resource, sys",
+        f"sys.path.insert(0, {ROOT!r})",
+        "import utils",
+        f"utils.set_memory_budget({BUDGET})",
+        f"utils.temp_folder = {str(temp_folder)!r}",
+        "before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss",
+        code,
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)",
+    ])
+    res = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True)
+
+    return int(res.stdout.split()[-1]) * 1024  # ru_maxrss is in KB on Linux
+
+
+def check_peak_rss(benchmark, code, temp_folder):
+    growth = benchmark.pedantic(get_peak_rss_growth, args=(code, temp_folder), rounds=1)
+    benchmark.extra_info["peak_rss_growth"] = growth
+
+    assert growth < BUDGET
+
+
+@pytest.fixture(scope="session")
+def large_iso(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("large_iso")
+    data_bin = write_random_file(Path(folder, "DATA.BIN"), LARGE_SIZE)
+    return make_iso(Path(folder, "game.iso"), data_bin)
+
+
+def bench_peak_rss_get_iso_hash(benchmark, large_iso, temp_folder):
+    check_peak_rss(benchmark, f"utils.get_iso_hash({str(large_iso)!r})", temp_folder)
+
+
+def bench_peak_rss_copy_file(benchmark, large_iso, temp_folder):
+    check_peak_rss(benchmark, f"utils.copy_file({str(large_iso)!r}, {str(Path(temp_folder, 'game.iso'))!r})",
+                   temp_folder)
+
+
+def bench_peak_rss_extract_data_bin(benchmark, large_iso, temp_folder):
+    check_peak_rss(benchmark, f"utils.extract_data_bin({str(large_iso)!r})", temp_folder)
+
+
+def bench_peak_rss_generate_filebin(benchmark, tmp_path, temp_folder):
+    # A few mods bigger than the budget
+    names = [path for _, path in get_filelist_entries(2)]
+    infolder = make_files_folder(Path(tmp_path, "mods"), names, 2 * BUDGET)
+    outfolder = Path(tmp_path, "NATIVEPSP")
+    check_peak_rss(benchmark, f"utils.generate_filebin({str(infolder)!r}, {str(outfolder)!r})", temp_folder)
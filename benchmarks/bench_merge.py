@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import utils
+from fixtures import PACK_COUNT
+
+
+def bench_generate_filebin_merge(benchmark, tmp_path, mods, packs):
+    # Every file is in all three sources, the last one wins each of them
+    sources = [mods, packs["none"], mods]
+    conflicts = benchmark(utils.generate_filebin, sources, Path(tmp_path, "NATIVEPSP"))
+
+    assert len(conflicts) == PACK_COUNT
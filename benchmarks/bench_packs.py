@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import pytest
+
+import modpack
+import utils
+
+
+@pytest.mark.parametrize("codec", list(modpack.CODECS))
+def bench_build_mod_pack(benchmark, tmp_path, mods, codec):
+    try:
+        codec = modpack.get_codec(codec)
+    except ValueError as e:
+        pytest.skip(str(e))
+
+    benchmark.pedantic(utils.build_mod_pack, args=(mods, Path(tmp_path, "mods.fucpack"), codec), rounds=3)
+
+
+@pytest.mark.parametrize("codec", list(modpack.CODECS))
+def bench_generate_filebin_pack(benchmark, tmp_path, packs, codec):
+    if codec not in packs:
+        pytest.skip(f"no {codec} support")
+
+    benchmark(utils.generate_filebin, packs[codec], Path(tmp_path, "NATIVEPSP"))
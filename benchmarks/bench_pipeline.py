@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import pytest
+
+import patcher
+import utils
+from fixtures import MB, make_data_bin, make_game, read_filelist_count
+
+SIZES_MB = [16, 64]
+
+needs_tools = pytest.mark.skipif(not all(utils.get_exe_path(name).exists() for name in ["xdelta3", "UMD-replace"]),
+                                 reason="needs xdelta3 and UMD-replace in bin")
+
+
+def get_entries():
+    return read_filelist_count(Path(utils.resources_path, "filelist.csv"))
+
+
+@pytest.fixture(scope="session", params=SIZES_MB)
+def game(request, tmp_path_factory):
+    folder = tmp_path_factory.mktemp(f"game_{request.param}")
+    return make_game(folder, request.param * MB, get_entries(), utils.get_exe_path("xdelta3"))
+
+
+@needs_tools
+@pytest.mark.parametrize("psp_go", [False, True])
+def bench_patch_iso(benchmark, game, tmp_path, psp_go):
+    kwargs = {
+        "outfolder": tmp_path,
+        "psp_go": psp_go,
+        "keep_databin": True,
+        "checksums": game["checksums"],
+        "patches_folder": game["patches"],
+    }
+    _, valid = benchmark.pedantic(patcher.run_patch, args=(game["iso"], utils.PSN_MD5HASH), kwargs=kwargs, rounds=1)
+
+    assert valid
+
+
+@pytest.mark.parametrize("size", SIZES_MB)
+def bench_dump_data_bin(benchmark, tmp_path, size):
+    data_bin = make_data_bin(Path(tmp_path, "DATA.BIN.DEC"), get_entries(), size * MB)
+    benchmark.pedantic(utils.dump_data_bin_folder, args=(data_bin,), rounds=3)
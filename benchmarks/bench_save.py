@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+import utils
+from fixtures import make_quests
+
+COUNTS = [1, 6, utils.QUESTS_SLOTS]
+
+
+def get_quest_dicts(count):
+    res = []
+    for quest in make_quests(count):
+        qid, name = utils.get_quest_data(quest)
+        res.append({"bytes": quest, "qid": qid, "name": name})
+
+    return res
+
+
+def get_empty_save():
+    return bytearray(utils.QUESTS_END + 0x1000)
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def bench_add_quests_to_save(benchmark, count):
+    quests = get_quest_dicts(count)
+    benchmark(utils.add_quests_to_save, get_empty_save(), quests)
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def bench_get_quests_in_save(benchmark, count):
+    save = utils.add_quests_to_save(get_empty_save(), get_quest_dicts(count))
+    benchmark(utils.get_quests_in_save, save)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import utils
+from fixtures import PACK_COUNT
+
+
+def bench_sync_unchanged(benchmark, tmp_path, packs):
+    nativepsp = Path(tmp_path, "NATIVEPSP")
+    target = Path(tmp_path, "nativePSP")
+    utils.generate_filebin(packs["none"], nativepsp)
+    utils.sync_nativepsp(nativepsp, target)
+
+    res = benchmark(utils.sync_nativepsp, nativepsp, target)
+
+    assert res["copied"] == 0 and res["unchanged"] == PACK_COUNT
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import modpack  # noqa: E402
+import utils  # noqa: E402
+from bench_files import get_filelist_entries  # noqa: E402
+from fixtures import (MB, PACK_COUNT, PACK_FILE_SIZE, SIZES_MB, make_files_folder, make_iso,  # noqa: E402
+                      write_random_file)
+
+
+def pytest_configure(config):
+    # Runs are saved next to this file wherever pytest is started from,
+    # unless another storage is passed on the command line
+    if config.getoption("benchmark_storage", None) == "file://./.benchmarks":
+        config.option.benchmark_storage = Path(__file__).parent.joinpath("history").as_uri()
+
+
+@pytest.fixture(autouse=True)
+def temp_folder(tmp_path, monkeypatch):
+    # Keep res/temp out of the way
+    folder = Path(tmp_path, "temp")
+    folder.mkdir()
+    monkeypatch.setattr(utils, "temp_folder", folder)
+
+    return folder
+
+
+@pytest.fixture(scope="session")
+def data_bins(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("data_bin")
+    return {size: write_random_file(Path(folder, f"DATA_{size}.BIN"), size * MB, seed=size) for size in SIZES_MB}
+
+
+@pytest.fixture(scope="session")
+def isos(tmp_path_factory, data_bins):
+    folder = tmp_path_factory.mktemp("iso")
+    return {size: make_iso(Path(folder, f"game_{size}.iso"), data_bin) for size, data_bin in data_bins.items()}
+
+
+@pytest.fixture(scope="session")
+def mods(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("mods")
+    return make_files_folder(folder, [path for _, path in get_filelist_entries(PACK_COUNT)], PACK_FILE_SIZE)
+
+
+@pytest.fixture(scope="session")
+def packs(tmp_path_factory, mods):
+    folder = tmp_path_factory.mktemp("packs")
+    res = {}
+    for name in modpack.CODECS:
+        try:
+            codec = modpack.get_codec(name)
+        except ValueError:
+            continue  # Compression package not installed
+
+        res[name] = Path(folder, f"{name}.fucpack")
+        utils.build_mod_pack(mods, res[name], codec)
+
+    return res
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import csv
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import mhef.psp
+import pycdlib
+
+MB = 1024 * 1024
+SIZES_MB = [1, 16, 64]
+
+# Mods folder the pack benchmarks are built from
+PACK_COUNT = 2000
+PACK_FILE_SIZE = 4 * 1024
+
+SECTOR_SIZE = 0x800
+ENTRY_SIZE = 8
+
+QUEST_MAGIC = b"\x4C\x00\x00\x00\x32\x4E\x44\x47"
+
+
+def write_random_file(path, size, seed=0):
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        left = size
+        while left:
+            count = min(MB, left)
+            f.write(rng.randbytes(count))
+            left -= count
+
+    return path
+
+
+def make_data_bin(path, entries, size, seed=0):
+    # Decrypted DATA.BIN layout: a table with the (sector, size) of every
+    # entry, then the files, each starting on a sector boundary
+    table_size = align(entries * ENTRY_SIZE)
+    file_size = max((size - table_size) // entries // SECTOR_SIZE, 1) * SECTOR_SIZE
+
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        table = bytearray()
+        for i in range(entries):
+            table += ((table_size + i * file_size) // SECTOR_SIZE).to_bytes(4, byteorder="little")
+            table += file_size.to_bytes(4, byteorder="little")
+
+        f.write(table.ljust(table_size, b"\x00"))
+        for _ in range(entries):
+            f.write(rng.randbytes(file_size))
+
+    return path
+
+
+def align(size):
+    return (size + SECTOR_SIZE - 1) // SECTOR_SIZE * SECTOR_SIZE
+
+
+def make_iso(path, data_bin_path):
+    iso = pycdlib.PyCdlib()
+    iso.new(interchange_level=4)
+    iso.add_directory("/PSP_GAME")
+    iso.add_directory("/PSP_GAME/USRDIR")
+
+    with open(data_bin_path, "rb") as f:
+        iso.add_fp(f, os.path.getsize(data_bin_path), "/PSP_GAME/USRDIR/DATA.BIN")
+        iso.write(path)
+
+    iso.close()
+
+    return path
+
+
+def make_quest(qid, name, size=0x2000, seed=0):
+    # Decrypted quest layout, only the parts get_quest_data reads are real
+    rng = random.Random(seed)
+    quest = bytearray(rng.randbytes(size).replace(b"\x00", b"\x01"))
+    quest[0x00:0x08] = QUEST_MAGIC
+    quest[0x64:0x66] = qid.to_bytes(2, byteorder="little")
+
+    name = name.encode()
+    quest[0x80:0x80 + len(name) + 1] = name + b"\x00"
+
+    return quest
+
+
+def make_quests(count, size=0x2000):
+    return [make_quest(60000 + i, f"Quest {i}", size, seed=i) for i in range(count)]
+
+
+def make_config_entries(count, seed=0):
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        values = [{"label": f"Value {v}", "data": f"0x{v:02X}"} for v in range(rng.randint(2, 8))]
+        entries.append({"description": f"Option {i}", "options": {"offset": f"0x{i * 4:04X}", "values": values}})
+
+    return entries
+
+
+def make_files_folder(folder, names, size, seed=0):
+    # One file per name, nested folders are created as needed
+    for i, name in enumerate(names):
+        path = Path(folder, name)
+        os.makedirs(path.parent, exist_ok=True)
+        write_random_file(path, size, seed + i)
+
+    return folder
+
+
+def mutate_file(src, dest, start=0, seed=0):
+    # Stands in for a patch, a sector of every MB after start is rewritten
+    shutil.copyfile(src, dest)
+    size = os.path.getsize(dest)
+
+    rng = random.Random(seed)
+    with open(dest, "r+b") as f:
+        for offset in range(start, size - SECTOR_SIZE + 1, MB):
+            f.seek(offset + rng.randrange(0, min(MB, size - offset) - SECTOR_SIZE + 1, SECTOR_SIZE))
+            f.write(rng.randbytes(SECTOR_SIZE))
+
+    return dest
+
+
+def get_iso_file_offset(isofile, iso_path):
+    iso = pycdlib.PyCdlib()
+    iso.open(isofile)
+    offset = iso.get_record(iso_path=iso_path).extent_location() * SECTOR_SIZE
+    iso.close()
+
+    return offset
+
+
+def replace_iso_file(isofile, offset, data_path, dest):
+    # What UMD-replace does for a file of the same size
+    shutil.copyfile(isofile, dest)
+    with open(dest, "r+b") as f, open(data_path, "rb") as data:
+        f.seek(offset)
+        shutil.copyfileobj(data, f)
+
+    return dest
+
+
+def make_xdelta(xdelta, src, target, patch):
+    subprocess.run([str(xdelta), "-e", "-f", "-s", str(src), str(target), str(patch)], check=True)
+
+    return patch
+
+
+def get_md5(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "md5").hexdigest()
+
+
+def read_filelist_count(filelist_path):
+    with open(filelist_path) as f:
+        return sum(1 for _ in csv.reader(f))
+
+
+def make_game(folder, size, entries, xdelta, seed=0):
+    # A fake game ISO and patches that go through the same steps as the
+    # real ones, returns what patcher.patch() needs to run on it
+    folder = Path(folder)
+    work = Path(folder, "work")
+    patches = Path(folder, "patches")
+    os.makedirs(work, exist_ok=True)
+    os.makedirs(patches, exist_ok=True)
+
+    data_dec = make_data_bin(Path(folder, "DATA.BIN.DEC"), entries, size, seed)
+    data_bin = Path(work, "DATA.BIN")
+    mhef.psp.DataCipher(mhef.psp.MHP2G_JP).encrypt_file(str(data_dec), str(data_bin))
+
+    iso = make_iso(Path(folder, "game.iso"), data_bin)
+    offset = get_iso_file_offset(iso, "/PSP_GAME/USRDIR/DATA.BIN")
+
+    # The compat patch leaves the image as it is, so both the UMD and PSN
+    # paths end up with the same ISO for the FUC patch
+    make_xdelta(xdelta, iso, iso, Path(patches, "compat.xdelta"))
+
+    # Only bytes after the directory records change, the patched ISO stays readable
+    replaced = replace_iso_file(iso, offset, data_dec, Path(work, "replaced.iso"))
+    fuc = mutate_file(replaced, Path(work, "FUC.iso"), offset, seed + 1)
+    make_xdelta(xdelta, replaced, fuc, Path(patches, "FUC.xdelta"))
+
+    ef0 = mutate_file(fuc, Path(work, "FUC_ef0.iso"), offset, seed + 2)
+    make_xdelta(xdelta, fuc, ef0, Path(patches, "EF0.xdelta"))
+
+    checksums = [get_md5(fuc), get_md5(ef0)]
+    shutil.rmtree(work)
+
+    return {"iso": str(iso), "data_bin": str(data_dec), "patches": str(patches), "checksums": checksums}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes a fake MHFU ISO, DATA.BIN and patches for benchmarks")
+    parser.add_argument("folder", help="output folder")
+    parser.add_argument("--size", type=int, default=64, help="DATA.BIN size in MB")
+    parser.add_argument("--entries", type=int, help="DATA.BIN entries, defaults to the res/filelist.csv count")
+    parser.add_argument("--xdelta", default=shutil.which("xdelta3") or "xdelta3", help="xdelta3 executable")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    entries = args.entries or read_filelist_count(Path(__file__).parent.parent.joinpath("res", "filelist.csv"))
+    game = make_game(args.folder, args.size * MB, entries, args.xdelta, args.seed)
+
+    for key, value in game.items():
+        print(f"{key}: {value}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
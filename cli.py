@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import glob
+import logging
+import sys
+from pathlib import Path
+
+import modpack
+import patcher
+import profiling
+import utils
+
+
+def expand_targets(patterns):
+    targets = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        targets.extend(sorted(matches) if matches else [pattern])
+
+    return list(dict.fromkeys(targets))
+
+
+def config_apply(args):
+    try:
+        selections = utils.get_preset_selections(utils.get_config_json(args.preset))
+    except (OSError, ValueError) as e:
+        print(f"ERROR | {e}", file=sys.stderr)
+        return 2
+
+    targets = expand_targets(args.targets)
+
+    status = 0
+    for res in utils.apply_configs((path, selections) for path in targets):
+        if res["error"] is not None:
+            print(f"{res['path']}: error, {res['error'].strerror}", file=sys.stderr)
+            status = 1
+            continue
+
+        print(f"{res['path']}: {'changed' if res['changed'] else 'unchanged'}")
+
+    return status
+
+
+def patch(args):
+    try:
+        iso_hash = utils.get_iso_hash(args.iso)
+    except OSError as e:
+        print(f"ERROR | {e}", file=sys.stderr)
+        return 2
+
+    if iso_hash not in [utils.UMD_MD5HASH, utils.PSN_MD5HASH]:
+        print(f"ERROR | Invalid ISO, expected md5 {utils.UMD_MD5HASH} (UMD) or {utils.PSN_MD5HASH} (PSN)",
+              file=sys.stderr)
+        return 2
+
+    try:
+        out_path, valid = patcher.run_patch(args.iso, iso_hash, outfolder=args.output, psp_go=args.psp_go,
+                                            keep_databin=args.keep_databin)
+    except (OSError, RuntimeError) as e:
+        print(f"ERROR | Patching failed: {e}", file=sys.stderr)
+        return 1
+
+    if not valid:
+        print(f"ERROR | Patched ISO doesn't match the checksum: {out_path}", file=sys.stderr)
+        return 1
+
+    print(out_path)
+    return 0
+
+
+def pack_build(args):
+    try:
+        codec = modpack.get_codec(args.codec)
+        count = utils.build_mod_pack(args.folder, args.output, codec, base=args.base)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"ERROR | {e}", file=sys.stderr)
+        return 1
+
+    print(f"{args.output}: {count} files")
+    return 0
+
+
+def nativepsp(args):
+    try:
+        conflicts = utils.generate_filebin(args.sources, args.output, args.base)
+    except (OSError, ValueError) as e:
+        print(f"ERROR | {e}", file=sys.stderr)
+        return 1
+
+    for c in conflicts:
+        print(f"{c['id']} {c['path']}: {c['winner']} over {', '.join(c['overridden'])}")
+
+    print(args.output)
+    return 0
+
+
+def sync(args):
+    try:
+        res = utils.sync_nativepsp(args.folder, args.target)
+    except OSError as e:
+        print(f"ERROR | {e}", file=sys.stderr)
+        return 1
+
+    print(f"{args.target}: {res['copied']} copied, {res['deleted']} deleted, {res['unchanged']} unchanged")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fuctool", description=f"FUComplete Tool {utils.VERSION}")
+    parser.add_argument("--profile", action="store_true",
+                        help="save cProfile and tracemalloc data for every stage to the current folder")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        help="limit the buffers and worker processes used, for low memory devices")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    config_parser = commands.add_parser("config", help="CONFIG.BIN options")
+    config_commands = config_parser.add_subparsers(dest="action", required=True)
+
+    apply_parser = config_commands.add_parser("apply", help="apply a preset to one or more CONFIG.BIN files")
+    apply_parser.add_argument("--preset", required=True,
+                              help="json file mapping option descriptions to value labels")
+    apply_parser.add_argument("targets", nargs="+", help="CONFIG.BIN files, ** globs are expanded")
+    apply_parser.set_defaults(func=config_apply)
+
+    pack_parser = commands.add_parser("pack", help="File Replacer mod packs")
+    pack_commands = pack_parser.add_subparsers(dest="action", required=True)
+
+    build_parser = pack_commands.add_parser("build", help="pack a mods folder into a single file")
+    build_parser.add_argument("folder", help="mods folder, laid out like for the File Replacer")
+    build_parser.add_argument("output", help="pack file to write")
+    build_parser.add_argument("--codec", choices=list(modpack.CODECS), default="none",
+                              help="per file compression, zstd and lz4 need their python packages")
+    build_parser.add_argument("--base", help="dumped DATA.BIN folder, files are stored as deltas against it")
+    build_parser.set_defaults(func=pack_build)
+
+    nativepsp_parser = commands.add_parser("nativepsp", help="generate a NATIVEPSP folder")
+    nativepsp_parser.add_argument("sources", nargs="+", help="mods folders or packs, later ones win conflicts")
+    nativepsp_parser.add_argument("--output", default="NATIVEPSP", help="folder to write, NATIVEPSP by default")
+    nativepsp_parser.add_argument("--base", help="dumped DATA.BIN folder, needed for packs built with --base")
+    nativepsp_parser.set_defaults(func=nativepsp)
+
+    sync_parser = commands.add_parser("sync", help="copy only the changed NATIVEPSP files to a memory stick")
+    sync_parser.add_argument("folder", help="generated NATIVEPSP folder")
+    sync_parser.add_argument("target", help="nativePSP folder on the memory stick, like /media/PSP/FUC/nativePSP")
+    sync_parser.set_defaults(func=sync)
+
+    patch_parser = commands.add_parser("patch", help="patch an MHFU ISO to FUComplete")
+    patch_parser.add_argument("iso", help="UMD or PSN dump of MHFU")
+    patch_parser.add_argument("--output", help="folder for the patched ISO, defaults to the ISO folder")
+    patch_parser.add_argument("--psp-go", action="store_true", help="apply the PSP Go internal storage patch")
+    patch_parser.add_argument("--keep-databin", action="store_true", help="also extract the patched DATA.BIN")
+    patch_parser.set_defaults(func=patch)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(message)s")
+
+    if args.profile:
+        profiling.enable(Path.cwd())
+    if args.memory_budget:
+        utils.set_memory_budget(args.memory_budget * 1024 * 1024)
+
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
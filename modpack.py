@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Pack layout: header, table of contents, then the entries' data in TOC order
+MAGIC = b"FUCP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")  # magic, version, reserved, entry count
+ENTRY = struct.Struct("<8sB7xQQQ")  # file ID, codec, offset, stored size, raw size
+
+CODEC_NONE = 0
+CODEC_ZSTD = 1
+CODEC_LZ4 = 2
+CODECS = {"none": CODEC_NONE, "zstd": CODEC_ZSTD, "lz4": CODEC_LZ4}
+
+# xdelta3 patch against the file of the same ID in a dumped DATA.BIN
+CODEC_DELTA = 3
+
+xdelta_path = "xdelta3"
+
+# Default read and write size, utils passes its memory budget aware one
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_pack(path):
+    if not os.path.isfile(path):
+        return False
+
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def get_codec(name):
+    codec = CODECS[name]
+    if codec == CODEC_ZSTD and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package")
+    if codec == CODEC_LZ4 and lz4 is None:
+        raise ValueError("lz4 compression needs the lz4 package")
+
+    return codec
+
+
+def compress_stream(fin, fout, codec, chunk_size=CHUNK_SIZE):
+    # Returns the number of bytes written to fout
+    start = fout.tell()
+    if codec == CODEC_ZSTD:
+        zstandard.ZstdCompressor(level=19).copy_stream(fin, fout, read_size=chunk_size, write_size=chunk_size)
+    elif codec == CODEC_LZ4:
+        compressor = lz4.frame.LZ4FrameCompressor(compression_level=lz4.frame.COMPRESSIONLEVEL_MINHC)
+        fout.write(compressor.begin())
+        while chunk := fin.read(chunk_size):
+            fout.write(compressor.compress(chunk))
+        fout.write(compressor.flush())
+
+    return fout.tell() - start
+
+
+def decompress_stream(data, fout, codec, raw_size, chunk_size=CHUNK_SIZE):
+    # data is the stored entry, the output never has more than a chunk in memory
+    start = fout.tell()
+    try:
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ValueError("Pack entry is zstd compressed, install the zstandard package")
+
+            writer = zstandard.ZstdDecompressor().stream_writer(fout, write_size=chunk_size)
+            for pos in range(0, len(data), chunk_size):
+                writer.write(data[pos:pos + chunk_size])
+            writer.flush()
+        elif codec == CODEC_LZ4:
+            if lz4 is None:
+                raise ValueError("Pack entry is lz4 compressed, install the lz4 package")
+
+            decompressor = lz4.frame.LZ4FrameDecompressor()
+            for pos in range(0, len(data), chunk_size):
+                chunk = data[pos:pos + chunk_size]
+                while not decompressor.eof:
+                    fout.write(decompressor.decompress(chunk, max_length=chunk_size))
+                    chunk = b""
+                    if decompressor.needs_input:
+                        break
+    except (RuntimeError, getattr(zstandard, "ZstdError", RuntimeError)) as e:
+        raise ValueError(f"Pack entry is corrupted: {e}") from e
+
+    written = fout.tell() - start
+    if written != raw_size:
+        raise ValueError(f"Pack entry is {written} bytes, expected {raw_size}")
+
+
+def make_delta(base, path, fout):
+    # The patch goes straight to fout, a real file
+    fout.flush()
+    result = subprocess.run([xdelta_path, "-e", "-9", "-c", "-s", str(base), str(path)], stdout=fout,
+                            stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"xdelta3 exited with {result.returncode}: {result.stderr.decode(errors='replace')}")
+
+
+def apply_delta(base, data, fout, chunk_size=CHUNK_SIZE):
+    # data is fed to xdelta3 a chunk at a time, it writes the file to fout.
+    # stderr goes to a file so a chatty xdelta3 can't block on it
+    fout.flush()
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen([xdelta_path, "-d", "-c", "-s", str(base)], stdin=subprocess.PIPE, stdout=fout,
+                                stderr=err)
+        try:
+            for pos in range(0, len(data), chunk_size):
+                proc.stdin.write(data[pos:pos + chunk_size])
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # Exited early, the return code says why
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.wait()
+
+        if proc.returncode != 0:
+            # Usually a base file that isn't the one the pack was built against
+            err.seek(0)
+            raise ValueError(f"Couldn't rebuild from {base}: {err.read().decode(errors='replace').strip()}")
+
+
+def write_pack(files, outpath, codec=CODEC_NONE, progress=None, bases=None, chunk_size=CHUNK_SIZE):
+    # files is a list of (file ID, path), entries are stored sorted by ID.
+    # bases maps file IDs to the original game file, those entries are
+    # stored as a delta when that's the smallest
+    files = sorted(files)
+    bases = bases or {}
+
+    with open(outpath, "w+b") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(files)))
+        f.seek(HEADER.size + ENTRY.size * len(files))
+
+        toc = []
+        for i, (idx, path) in enumerate(files):
+            offset = f.tell()
+            raw_size = os.path.getsize(path)
+
+            entry_codec = CODEC_NONE
+            if codec != CODEC_NONE:
+                with open(path, "rb") as fin:
+                    # Only kept compressed when it's worth it
+                    if compress_stream(fin, f, codec, chunk_size) < raw_size:
+                        entry_codec = codec
+                    else:
+                        f.seek(offset)
+                        f.truncate()
+
+            if entry_codec == CODEC_NONE:
+                with open(path, "rb") as fin:
+                    shutil.copyfileobj(fin, f, chunk_size)
+
+            if idx in bases:
+                with tempfile.TemporaryFile(dir=Path(outpath).parent) as delta:
+                    make_delta(bases[idx], path, delta)
+                    if delta.seek(0, os.SEEK_END) < f.tell() - offset:
+                        f.seek(offset)
+                        f.truncate()
+                        delta.seek(0)
+                        shutil.copyfileobj(delta, f, chunk_size)
+                        entry_codec = CODEC_DELTA
+
+            toc.append(ENTRY.pack(idx.encode(), entry_codec, offset, f.tell() - offset, raw_size))
+            if progress is not None:
+                progress(i + 1, len(files))
+
+        f.seek(HEADER.size)
+        f.write(b"".join(toc))
+
+
+class ModPack:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+        self.file = open(path, "rb")
+        self.mm = None
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.read_toc()
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self.close()
+            raise ValueError(f"{path} is not a supported mod pack or is incomplete: {e}") from e
+
+        # Entries are read front to back
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self.mm.madvise(mmap.MADV_SEQUENTIAL)
+
+    def read_toc(self):
+        magic, version, _, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unknown header")
+
+        # A pack cut short (a partial download) would give truncated files
+        for i in range(count):
+            idx, codec, offset, size, raw_size = ENTRY.unpack_from(self.mm, HEADER.size + i * ENTRY.size)
+            idx = idx.rstrip(b"\x00").decode()
+            if offset + size > len(self.mm) or (codec == CODEC_NONE and size != raw_size):
+                raise ValueError(f"entry {idx} is out of bounds")
+
+            self.entries[idx] = (codec, offset, size, raw_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
+
+    def get_size(self, idx):
+        return self.entries[idx][3]
+
+    def is_delta(self, idx):
+        return self.entries[idx][0] == CODEC_DELTA
+
+    def write_to(self, idx, fout, base=None, chunk_size=CHUNK_SIZE):
+        codec, offset, size, raw_size = self.entries[idx]
+        if codec == CODEC_DELTA and base is None:
+            raise ValueError(f"{self.path} has deltas, a dumped DATA.BIN is needed to rebuild file {idx}")
+
+        # Read from the mapping without a copy
+        data = memoryview(self.mm)[offset:offset + size]
+        try:
+            if codec == CODEC_DELTA:
+                apply_delta(base, data, fout, chunk_size)
+            elif codec != CODEC_NONE:
+                decompress_stream(data, fout, codec, raw_size, chunk_size)
+            else:
+                fout.write(data)
+        finally:
+            data.release()
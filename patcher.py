@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import utils
+
+patches_path = Path(utils.current_path, "res", "patches")
+
+# One event loop on its own thread runs every patch job
+loop = None
+loop_lock = threading.Lock()
+
+
+async def run_in_thread(fn, *args, progress=None):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, progress=progress))
+
+
+async def log_stderr(stream):
+    while line := await stream.readline():
+        logging.error(line.decode("utf8").rstrip())
+
+
+async def start_tool(name, args, stdout=asyncio.subprocess.DEVNULL):
+    return await asyncio.create_subprocess_exec(str(utils.get_exe_path(name)), *[str(a) for a in args],
+                                                stdout=stdout, stderr=asyncio.subprocess.PIPE)
+
+
+async def run_tool(name, args, progress=None, output=None, total=0):
+    proc = await start_tool(name, args)
+    stderr = asyncio.create_task(log_stderr(proc.stderr))
+    wait = asyncio.ensure_future(proc.wait())
+
+    # The tools don't report progress, the output size is polled instead
+    try:
+        while not wait.done():
+            utils.report(progress, utils.get_file_size(output) if output else 0, total)
+            await asyncio.wait([wait], timeout=0.5)
+    except BaseException:
+        proc.kill()
+        await wait
+        raise
+    finally:
+        await stderr
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"{name} exited with {proc.returncode}")
+
+
+async def apply_xdelta(src, patch, dest, progress=None):
+    await run_tool("xdelta3", ["-d", "-s", src, patch, dest], progress, dest, utils.get_file_size(src))
+
+
+async def apply_xdelta_hashed(src, patch, dest, progress=None):
+    # xdelta3 writes to stdout and the output is hashed on its way to dest,
+    # so the patched ISO doesn't have to be read back to be checked
+    total = utils.get_file_size(src)
+    proc = await start_tool("xdelta3", ["-d", "-c", "-s", src, patch], asyncio.subprocess.PIPE)
+    stderr = asyncio.create_task(log_stderr(proc.stderr))
+    file_hash = hashlib.md5()
+
+    # Written next to dest and renamed over it, never moved across filesystems
+    part_path = get_part_path(dest)
+    loop = asyncio.get_running_loop()
+    try:
+        # Patched ISOs are the size of the source, close enough to preallocate.
+        # Writes can sync to disk, they're kept off the event loop
+        f = utils.OutputFile(part_path, total)
+        try:
+            while chunk := await proc.stdout.read(utils.get_chunk_size()):
+                file_hash.update(chunk)
+                await loop.run_in_executor(None, f.write, chunk)
+                utils.report(progress, f.pos, total)
+        finally:
+            await loop.run_in_executor(None, f.close)
+
+        await proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"xdelta3 exited with {proc.returncode}")
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    finally:
+        await stderr
+
+    os.replace(part_path, dest)
+
+    return file_hash.hexdigest()
+
+
+def get_part_path(path):
+    path = Path(path)
+    return path.with_name("." + path.name + ".part")
+
+
+async def export_databin(iso_path, dest, progress=None):
+    part_path = get_part_path(dest)
+    try:
+        await run_in_thread(utils.copy_iso_file, iso_path, "/PSP_GAME/USRDIR/DATA.BIN", part_path,
+                            progress=progress)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    os.replace(part_path, dest)
+    logging.info(f"DATA.BIN saved to: {dest}")
+
+
+async def patch(iso_path, iso_hash, outfolder=None, psp_go=False, keep_databin=False, checksums=None,
+                patches_folder=None, progress=None):
+    iso_path = Path(iso_path)
+    outfolder = Path(outfolder) if outfolder else iso_path.parent
+    checksums = utils.config["iso_checksum"] if checksums is None else checksums
+    patches_folder = Path(patches_folder) if patches_folder else patches_path
+
+    utils.create_temp_folder()
+    try:
+        if iso_hash == utils.UMD_MD5HASH:
+            logging.info("UMD ISO found, applying compat patch...")
+            work_iso = Path(utils.temp_folder, iso_path.stem + "_compat.iso")
+            await apply_xdelta(iso_path, Path(patches_folder, "compat.xdelta"), work_iso, progress)
+            logging.info("Compat patching done.")
+        else:
+            logging.info("Copying ISO...")
+            work_iso = Path(utils.temp_folder, iso_path.name)
+            await run_in_thread(utils.copy_file, iso_path, work_iso, progress=progress)
+
+        logging.info("Extracting DATA.BIN...")
+        data_bin = await run_in_thread(utils.extract_data_bin, work_iso, progress=progress)
+
+        logging.info("Decrypting DATA.BIN (this may take a few minutes)...")
+        data_dec = Path(utils.temp_folder, "DATA.BIN.DEC")
+        await run_in_thread(utils.decrypt_data_bin, data_bin, data_dec, progress=progress)
+        os.remove(data_bin)
+
+        logging.info("Replacing DATA.BIN...")
+        await run_tool("UMD-replace", [work_iso, "/PSP_GAME/USRDIR/DATA.BIN", data_dec], progress)
+        os.remove(data_dec)
+
+        # The last patch applied writes the patched ISO straight to outfolder
+        # and computes its checksum
+        logging.info("Patching ISO...")
+        if psp_go:
+            fuc_iso = Path(utils.temp_folder, work_iso.stem + "_FUC.iso")
+            await apply_xdelta(work_iso, Path(patches_folder, "FUC.xdelta"), fuc_iso, progress)
+            os.remove(work_iso)
+
+            logging.info("Applying PSP Go internal storage patch...")
+            out_path = Path(outfolder, iso_path.stem + "_FUC_ef0.iso")
+            patched_hash = await apply_xdelta_hashed(fuc_iso, Path(patches_folder, "EF0.xdelta"), out_path, progress)
+            os.remove(fuc_iso)
+            logging.info("PSP Go internal storage patching done.")
+        else:
+            out_path = Path(outfolder, iso_path.stem + "_FUC.iso")
+            patched_hash = await apply_xdelta_hashed(work_iso, Path(patches_folder, "FUC.xdelta"), out_path, progress)
+            os.remove(work_iso)
+
+        if keep_databin:
+            logging.info("Saving patched DATA.BIN...")
+            await export_databin(out_path, Path(outfolder, "DATA.BIN"), progress)
+    finally:
+        shutil.rmtree(utils.temp_folder, ignore_errors=True)
+
+    return str(out_path), patched_hash in checksums
+
+
+def get_loop():
+    global loop
+
+    with loop_lock:
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="patcher-loop", daemon=True).start()
+
+    return loop
+
+
+def run_patch(*args, progress=None, **kwargs):
+    # Blocks the calling thread (a Job) until the patch running on the shared loop is done
+    future = asyncio.run_coroutine_threadsafe(patch(*args, progress=progress, **kwargs), get_loop())
+    return future.result()
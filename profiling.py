@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import cProfile
+import functools
+import itertools
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import utils
+
+# utils functions that start a user visible operation
+UTILS_STAGES = [
+    "get_iso_hash",
+    "copy_file",
+    "extract_data_bin",
+    "decrypt_data_bin",
+    "dump_data_bin_folder",
+    "generate_filebin",
+    "sync_nativepsp",
+    "read_replace_folder",
+    "read_configs",
+    "apply_config_file",
+    "apply_configs",
+    "decrypt_save",
+    "encrypt_save",
+    "decrypt_quest_files",
+    "get_quests_in_save",
+    "add_quests_to_save",
+]
+
+# utils functions run on thread pools, their calls are added to the profile
+# of the stage that started them
+UTILS_WORKERS = [
+    "read_quest_info",
+    "get_quest_file_digest",
+    "get_file_digest",
+]
+
+enabled = False
+output_folder = Path.cwd()
+
+counter = itertools.count(1)
+local = threading.local()
+tracing_lock = threading.Lock()
+tracing_count = 0
+
+# Worker profiles collected for each running stage
+collectors = []
+collectors_lock = threading.Lock()
+
+
+def enable(folder):
+    global enabled, output_folder
+
+    instrument()
+    output_folder = Path(folder)
+    enabled = True
+
+    logging.info(f"Profiling enabled, profiles are saved to: {output_folder.absolute()}")
+
+
+def disable():
+    global enabled
+
+    enabled = False
+    logging.info("Profiling disabled.")
+
+
+def instrument():
+    for name in UTILS_STAGES:
+        fn = getattr(utils, name)
+        if not getattr(fn, "profiled", False):
+            setattr(utils, name, profiled(fn))
+
+    for name in UTILS_WORKERS:
+        fn = getattr(utils, name)
+        if not getattr(fn, "profiled", False):
+            setattr(utils, name, profiled_worker(fn))
+
+    if not getattr(utils.run_in_process, "profiled", False):
+        utils.run_in_process = profiled_process(utils.run_in_process)
+
+
+def profiled(fn, name=None):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(name or fn.__name__):
+            return fn(*args, **kwargs)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def profiled_worker(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Called from the stage's own thread, its profiler already sees it
+        if not collectors or getattr(local, "active", False):
+            return fn(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with collectors_lock:
+                for collector in collectors:
+                    collector.append(profiler)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def profiled_process(fn):
+    # The work of decrypt_data_bin and dump_data_bin_folder happens in a
+    # child process, it writes its own profile tagged with the stage name
+    @functools.wraps(fn)
+    def wrapper(target, args, *rest, **kwargs):
+        if not enabled:
+            return fn(target, args, *rest, **kwargs)
+
+        base = get_base_path(f"{getattr(local, 'name', None) or 'process'}-{target.__name__}-child")
+        return fn(functools.partial(profile_in_child, target, str(base)), args, *rest, **kwargs)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def profile_in_child(target, base, *args):
+    profiler = cProfile.Profile()
+    tracemalloc.start(10)
+    profiler.enable()
+
+    try:
+        return target(*args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(f"{base}.prof")
+        tracemalloc.take_snapshot().dump(f"{base}.tracemalloc")
+        tracemalloc.stop()
+
+
+def get_base_path(name):
+    return Path(output_folder, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{next(counter):03d}-{name}")
+
+
+def start_tracing():
+    global tracing_count
+
+    # tracemalloc is process wide, it runs while any stage does
+    with tracing_lock:
+        if tracing_count == 0:
+            tracemalloc.start(10)
+        tracing_count += 1
+
+
+def stop_tracing():
+    global tracing_count
+
+    with tracing_lock:
+        tracing_count -= 1
+        if tracing_count == 0:
+            tracemalloc.stop()
+
+
+@contextmanager
+def stage(name):
+    # Nested stages are part of the outer one's profile
+    if not enabled or getattr(local, "active", False):
+        yield
+        return
+
+    local.active = True
+    local.name = name
+    collector = []
+    with collectors_lock:
+        collectors.append(collector)
+
+    profiler = cProfile.Profile()
+    start_tracing()
+    profiler.enable()
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        stop_tracing()
+        local.active = False
+        local.name = None
+        with collectors_lock:
+            collectors.remove(collector)
+
+        # Quest decryption runs on a process pool, its workers aren't covered
+        stats = pstats.Stats(profiler)
+        for worker in collector:
+            stats.add(worker)
+
+        base = get_base_path(name)
+        try:
+            stats.dump_stats(f"{base}.prof")
+            snapshot.dump(f"{base}.tracemalloc")
+            logging.info(f"Profile for {name} saved to: {base}.prof")
+        except OSError as e:
+            logging.error(f"Couldn't save profile for {name}: {e}")
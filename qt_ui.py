@@ -102,10 +102,10 @@ class Ui_MainWindow(object):
         self.config_bin_button.setObjectName("config_bin_button")
         self.horizontalLayout_2.addWidget(self.config_bin_button)
         self.config_verticalLayout.addLayout(self.horizontalLayout_2)
-        self.config_list = QtWidgets.QListWidget(self.verticalLayoutWidget_2)
+        self.config_list = QtWidgets.QListView(self.verticalLayoutWidget_2)
         self.config_list.setEnabled(False)
         self.config_list.setFocusPolicy(QtCore.Qt.NoFocus)
-        self.config_list.setStyleSheet("QListWidget::item { border-bottom: 1px solid lightgray; }")
+        self.config_list.setStyleSheet("QListView::item { border-bottom: 1px solid lightgray; }")
         self.config_list.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
         self.config_list.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
         self.config_list.setObjectName("config_list")
@@ -170,21 +170,14 @@ class Ui_MainWindow(object):
         self.refresh_replace_button.setObjectName("refresh_replace_button")
         self.horizontalLayout_6.addWidget(self.refresh_replace_button)
         self.verticalLayout.addLayout(self.horizontalLayout_6)
-        self.replace_list = QtWidgets.QTableWidget(self.verticalLayoutWidget_3)
+        self.replace_list = QtWidgets.QTableView(self.verticalLayoutWidget_3)
         self.replace_list.setEnabled(False)
         self.replace_list.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.replace_list.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
         self.replace_list.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.replace_list.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.replace_list.setSortingEnabled(True)
         self.replace_list.setObjectName("replace_list")
-        self.replace_list.setColumnCount(2)
-        self.replace_list.setRowCount(0)
-        item = QtWidgets.QTableWidgetItem()
-        item.setText("id")
-        self.replace_list.setHorizontalHeaderItem(0, item)
-        item = QtWidgets.QTableWidgetItem()
-        item.setText("path")
-        self.replace_list.setHorizontalHeaderItem(1, item)
         self.verticalLayout.addWidget(self.replace_list)
         self.horizontalLayout_4 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_4.setObjectName("horizontalLayout_4")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import fnmatch
+import os
+import secrets
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import utils
+
+# Bump when the table layout changes, the index is rebuilt from scratch
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quests (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    qid TEXT,
+    name TEXT,
+    encrypted INTEGER NOT NULL,
+    digest TEXT,
+    decrypt_failed INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class QuestIndex:
+    def __init__(self, folder, db_path):
+        self.folder = Path(folder)
+        self.db = sqlite3.connect(db_path)
+
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with self.db:
+                self.db.execute("DROP TABLE IF EXISTS quests")
+                self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self.db.execute(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def scan(self):
+        files = {}
+        if self.folder.is_dir():
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if is_quest_file(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        files[entry.name] = (st.st_mtime_ns, st.st_size)
+
+        cached = {}
+        for path, mtime, size in self.db.execute("SELECT path, mtime, size FROM quests"):
+            cached[path] = (mtime, size)
+
+        # Only files that are new or changed since the last scan are read
+        stale = [(path,) for path in cached if path not in files]
+        changed = [path for path, stat in files.items() if cached.get(path) != stat]
+
+        # Only the quest header is read, spread over a few threads
+        with ThreadPoolExecutor() as pool:
+            infos = pool.map(utils.read_quest_info, [Path(self.folder, path) for path in changed])
+
+            rows = []
+            for path, (qid, name) in zip(changed, infos):
+                mtime, size = files[path]
+                rows.append((path, mtime, size, qid, name, qid is None, None, False))
+
+        with self.db:
+            self.db.executemany("DELETE FROM quests WHERE path = ?", stale)
+            self.db.executemany("INSERT OR REPLACE INTO quests VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        self.update_digests()
+
+        return self.get_quests()
+
+    def update_digests(self):
+        # Quests can only be duplicates if they share a qid and payload size,
+        # so only those get read in full and hashed
+        groups = {}
+        for path, size, qid, digest in self.db.execute("SELECT path, size, qid, digest FROM quests "
+                                                       "WHERE encrypted = 0"):
+            key = (qid, size - utils.get_quest_header_size(path))
+            groups.setdefault(key, []).append((path, digest))
+
+        missing = []
+        for group in groups.values():
+            if len(group) > 1:
+                missing.extend(path for path, digest in group if digest is None)
+
+        with ThreadPoolExecutor() as pool:
+            digests = pool.map(utils.get_quest_file_digest, [Path(self.folder, path) for path in missing])
+
+            rows = [(digest, path) for path, digest in zip(missing, digests)]
+
+        with self.db:
+            self.db.executemany("UPDATE quests SET digest = ? WHERE path = ?", rows)
+
+    def get_quests(self):
+        # Ignore encrypted and arena/challenge quests
+        cursor = self.db.execute("SELECT path, qid, name, digest FROM quests "
+                                 "WHERE encrypted = 0 AND qid NOT LIKE '61%' ORDER BY qid, path")
+
+        res = []
+        seen = set()
+        for path, qid, name, digest in cursor:
+            # Same quest stored more than once (.pat and .mib, copies...)
+            if digest is not None:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+
+            res.append({"path": str(Path(self.folder, path)), "qid": qid, "name": name})
+
+        return res
+
+    def get_paths(self):
+        return [str(Path(self.folder, path)) for path, in self.db.execute("SELECT path FROM quests")]
+
+    def get_encrypted(self):
+        cursor = self.db.execute("SELECT path FROM quests WHERE encrypted = 1 ORDER BY path")
+
+        return [str(Path(self.folder, path)) for path, in cursor]
+
+    def get_undecrypted(self):
+        mtimes = dict(self.db.execute("SELECT path, mtime FROM quests"))
+        cursor = self.db.execute("SELECT path, mtime FROM quests "
+                                 "WHERE encrypted = 1 AND decrypt_failed = 0 AND path LIKE '%.mib' ORDER BY path")
+
+        # Encrypted quests without an up to date decrypted copy next to them
+        res = []
+        for path, mtime in cursor:
+            if mtimes.get(utils.get_decrypted_quest_path(path).name, -1) < mtime:
+                res.append(str(Path(self.folder, path)))
+
+        return res
+
+    def mark_decrypt_failed(self, paths):
+        with self.db:
+            self.db.executemany("UPDATE quests SET decrypt_failed = 1 WHERE path = ?",
+                                [(Path(path).name,) for path in paths])
+
+    def get_collisions(self):
+        # Different quests sharing the same qid
+        cursor = self.db.execute("SELECT qid, path, IFNULL(digest, path) FROM quests "
+                                 "WHERE encrypted = 0 ORDER BY qid, path")
+
+        qids = {}
+        for qid, path, digest in cursor:
+            qids.setdefault(qid, {}).setdefault(digest, str(Path(self.folder, path)))
+
+        return {qid: list(paths.values()) for qid, paths in qids.items() if len(paths) > 1}
+
+    def find_quest(self, qid, qfile):
+        digest = utils.get_quest_digest(qfile)
+        cursor = self.db.execute("SELECT path, size, digest FROM quests WHERE qid = ?", (qid,))
+
+        for path, size, row_digest in cursor.fetchall():
+            if size - utils.get_quest_header_size(path) != len(qfile):
+                continue
+
+            if row_digest is None:
+                try:
+                    row_digest = utils.get_quest_file_digest(Path(self.folder, path))
+                except OSError:
+                    continue  # Gone since the last scan, the next one drops it
+
+                with self.db:
+                    self.db.execute("UPDATE quests SET digest = ? WHERE path = ?", (row_digest, path))
+
+            # A cached digest can outlive its file, that's no backup
+            if row_digest == digest and Path(self.folder, path).is_file():
+                return str(Path(self.folder, path))
+
+        return None
+
+    def dedupe(self):
+        cursor = self.db.execute("SELECT digest, path, size FROM quests "
+                                 "WHERE digest IS NOT NULL ORDER BY digest, path")
+
+        groups = {}
+        for digest, path, size in cursor:
+            # Hardlinks need identical files, .pat headers included
+            key = (digest, size, utils.get_quest_header_size(path))
+            groups.setdefault(key, []).append(Path(self.folder, path))
+
+        saved = 0
+        for (_, size, header_size), paths in groups.items():
+            keep = paths[0]
+            for path in paths[1:]:
+                if os.path.samefile(keep, path):
+                    continue
+
+                if header_size and utils.read_file_range(keep, 0, header_size) != \
+                        utils.read_file_range(path, 0, header_size):
+                    continue
+
+                # Safe because every writer into the folder replaces files
+                # instead of writing through them (utils.replace_file_bytes)
+                tmp_path = path.with_name(f".dedupe-{secrets.token_hex(8)}.tmp")
+                try:
+                    os.link(keep, tmp_path)
+                except FileExistsError:
+                    continue
+                except OSError:
+                    return saved  # Filesystem without hardlink support
+
+                try:
+                    os.replace(tmp_path, path)
+                except OSError:
+                    os.remove(tmp_path)
+                    raise
+                saved += size
+
+        return saved
+
+
+def is_quest_file(name):
+    return fnmatch.fnmatch(name, "*.mib*") or fnmatch.fnmatch(name, "*.pat")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from pathlib import Path
+
+import utils
+
+
+class SaveSession:
+    def __init__(self, path, region):
+        self.path = Path(path)
+        self.region = region
+
+        self.save = None
+        self.slots = []
+        self.dirty = set()
+        self.encrypted = None
+
+    def load(self, progress=None):
+        utils.report(progress, 0, 0)
+        self.save = bytearray(utils.decrypt_save(self.path, self.region))
+        self.slots = [utils.get_quest_slot(self.save, i) for i in range(utils.QUESTS_SLOTS)]
+        self.dirty.clear()
+        self.encrypted = None
+
+    def get_quests(self):
+        return [q for q in self.slots if q is not None]
+
+    def set_quests(self, quests):
+        nslots = list(quests) + [None] * (utils.QUESTS_SLOTS - len(quests))
+
+        # Only slots whose quest changed get re-encrypted and written
+        for i, (old, new) in enumerate(zip(self.slots, nslots)):
+            if is_same_quest(old, new):
+                continue
+
+            empty = {"bytes": bytearray(), "qid": "", "name": ""}
+            utils.write_quest_slot(self.save, i, new or empty)
+
+            self.slots[i] = new
+            self.dirty.add(i)
+
+    def encrypt(self):
+        if self.encrypted is None or self.dirty:
+            self.encrypted = utils.encrypt_save(self.save, self.region)
+            self.dirty.clear()
+
+        return self.encrypted
+
+
+def is_same_quest(a, b):
+    if a is None or b is None:
+        return a is b
+
+    return a["qid"] == b["qid"] and a["bytes"] == b["bytes"]
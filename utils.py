@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import ctypes
 import csv
+import errno
 import glob
 import hashlib
 import json
+import mmap
+import multiprocessing
 import os
 import shutil
 import sys
-from io import BytesIO
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 
 import bitstring
@@ -17,6 +24,8 @@ import pycdlib
 import mhef.psp
 import mhff.psp.data
 
+import modpack
+
 VERSION = "1.2.1"
 
 UMD_MD5HASH = "1f76ee9ccbd6d39158f06e6e5354a5bd"
@@ -25,6 +34,32 @@ PSN_MD5HASH = "cc39d070b2d2c44c9ac8187e00b75dc4"
 QUESTS_START = 0x142300
 QUESTS_END = 0x169360
 QUESTS_SIZE = 0x22B0
+QUESTS_SLOTS = (QUESTS_END - QUESTS_START) // QUESTS_SIZE
+
+CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+ISO_BLOCK_SIZE = 2048
+# Writeback of written pages is started every this many bytes, the ones
+# before that are dropped from the page cache
+DROP_CACHE_SIZE = 64 * 1024 * 1024
+
+# From linux/fs.h
+SYNC_FILE_RANGE_WAIT_BEFORE = 0x01
+SYNC_FILE_RANGE_WRITE = 0x02
+SYNC_FILE_RANGE_WAIT_AFTER = 0x04
+
+# Enough to cover the quest id at 0x64 and the name at 0x80
+QUEST_HEADER_SIZE = 0x200
+QUEST_WORKER_SIZE = 32 * 1024 * 1024
+
+# Hashes of the files on the memory stick, so they aren't read back on every sync
+SYNC_CACHE_NAME = ".fucsync.json"
+SYNC_WORKERS = 4
+
+ConfigOption = namedtuple("ConfigOption", ["offset", "size", "values", "index"])
+
+# Regions tried in order when decrypting a quest
+QUEST_GAMES = (mhef.psp.MHP2G_JP, mhef.psp.MHP2G_NA, mhef.psp.MHP2G_EU)
 
 
 def read_file_bytes(filepath):
@@ -34,156 +69,753 @@ def read_file_bytes(filepath):
     return bytearray(bfile)
 
 
+def read_file_range(filepath, offset, size):
+    fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        if hasattr(os, "pread"):
+            return os.pread(fd, size, offset)
+
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
 def write_file_bytes(filepath, barray):
     with open(filepath, "wb") as f:
         f.write(barray)
 
 
+def replace_file_bytes(filepath, barray):
+    # New file renamed over the old one, a hardlink to it keeps the old bytes
+    fd, tmp_path = tempfile.mkstemp(prefix=".fuctool-", suffix=".tmp", dir=Path(filepath).parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(barray)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class Cancelled(Exception):
+    pass
+
+
+class ProgressWriter:
+    # File-like wrapper that reports how many bytes went through it
+    def __init__(self, fp, total, progress):
+        self.fp = fp
+        self.total = total
+        self.progress = progress
+        self.done = 0
+
+    def write(self, data):
+        n = self.fp.write(data)
+        self.done += len(data)
+        self.progress(self.done, self.total)
+        return n
+
+
+class OutputFile:
+    # Sequential writer for large outputs of a known size. The file is
+    # preallocated, all zero chunks (ISO padding) are skipped so they stay
+    # unwritten extents or holes, and written pages leave the page cache
+    def __init__(self, path, size, ranges=None):
+        self.f = open(path, "wb", buffering=0)
+        self.fd = self.f.fileno()
+        self.pos = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.zeros = b""
+
+        # Only the data ranges when copying a sparse file, its holes are kept
+        for offset, length in [(0, size)] if ranges is None else ranges:
+            preallocate(self.fd, offset, length)
+        advise(self.fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, data):
+        size = len(data)
+        if self.is_zero(data):
+            self.f.seek(size, os.SEEK_CUR)
+        else:
+            # Unbuffered, a write can take less than the whole chunk
+            view = memoryview(data)
+            while view:
+                view = view[self.f.write(view):]
+
+        self.pos += size
+        if self.pos - self.flushed >= DROP_CACHE_SIZE:
+            self.drop_cache()
+
+        return size
+
+    def is_zero(self, data):
+        # Chunks with data rarely end in a zero, those aren't compared
+        if not data or data[-1]:
+            return False
+
+        if len(self.zeros) != len(data):
+            self.zeros = bytes(len(data))
+
+        return data == self.zeros
+
+    def seek(self, offset):
+        self.f.seek(offset)
+        self.pos = offset
+
+    def drop_cache(self):
+        # Writeback of the new pages is only started. Dirty pages can't be
+        # dropped, the previous batch has had a whole batch of writes to
+        # reach the disk, it's waited on (rarely for long) and dropped
+        started = sync_range(self.fd, self.flushed, self.pos - self.flushed, SYNC_FILE_RANGE_WRITE)
+        # A length of 0 would mean up to the end of the file
+        if started and self.flushed > self.dropped:
+            sync_range(self.fd, self.dropped, self.flushed - self.dropped,
+                       SYNC_FILE_RANGE_WAIT_BEFORE | SYNC_FILE_RANGE_WRITE | SYNC_FILE_RANGE_WAIT_AFTER)
+            advise(self.fd, self.dropped, self.flushed - self.dropped, "POSIX_FADV_DONTNEED")
+            self.dropped = self.flushed
+        self.flushed = self.pos
+
+    def close(self):
+        if self.f.closed:
+            return
+
+        try:
+            # Sets the real size, skipped zeros at the end and unused preallocation included
+            self.f.truncate(self.pos)
+            self.drop_cache()
+        finally:
+            self.f.close()
+
+
+@lru_cache(maxsize=None)
+def get_libc():
+    # fallocate and sync_file_range aren't in os
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.fallocate64.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        libc.sync_file_range.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_uint]
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+def preallocate(fd, offset, size):
+    # One extent instead of one per write. fallocate(2) is called directly,
+    # posix_fallocate writes zeros over the range where the filesystem can't
+    # preallocate (vfat, exFAT, FUSE), so everything would be written twice.
+    # Any error (EOPNOTSUPP, ENOSYS) means no preallocation
+    libc = get_libc()
+    if size and libc is not None:
+        libc.fallocate64(fd, 0, offset, size)
+
+
+def sync_range(fd, offset, length, flags):
+    # False when the range can't be written back without a full fdatasync
+    libc = get_libc()
+    if libc is None:
+        return False
+
+    return length == 0 or libc.sync_file_range(fd, offset, length, flags) == 0
+
+
+def advise(fd, offset, length, advice):
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice))
+        except OSError:
+            pass
+
+
+def get_data_ranges(fd, size):
+    # (offset, size) of the parts of a sparse file that hold data, holes
+    # read as zeros and don't have to be read at all
+    if not hasattr(os, "SEEK_DATA"):
+        return [(0, size)]
+
+    ranges = []
+    offset = 0
+    try:
+        while offset < size:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            offset = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            ranges.append((start, offset - start))
+    except OSError as e:
+        if e.errno != errno.ENXIO:  # No data after offset
+            return [(0, size)]
+
+    return ranges
+
+
+def set_memory_budget(size):
+    # Caps the buffers and worker counts used by the I/O paths, None for no limit
+    global memory_budget
+    memory_budget = size
+
+
+def get_memory_budget_env():
+    budget = os.environ.get("FUCTOOL_MEMORY_BUDGET")  # in MB
+    return int(budget) * 1024 * 1024 if budget else None
+
+
+def get_chunk_size():
+    if memory_budget is None:
+        return CHUNK_SIZE
+
+    return max(MIN_CHUNK_SIZE, min(CHUNK_SIZE, memory_budget // 16))
+
+
+def get_max_workers(worker_size, default=None):
+    # Each worker takes about worker_size bytes, half the budget is left
+    # for everything else
+    if memory_budget is None:
+        return default
+
+    return max(1, min(default or os.cpu_count() or 1, memory_budget // 2 // worker_size))
+
+
+def report(progress, done, total):
+    if progress is not None:
+        progress(done, total)
+
+
+def run_in_process(target, args, progress=None, poll=None):
+    # Runs target in a child process so it can be killed when cancelled,
+    # poll() returns (done, total) while it runs
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=call_in_child, args=(child_conn, target, args), daemon=True)
+    proc.start()
+    child_conn.close()
+
+    try:
+        while proc.is_alive() and not parent_conn.poll(0.2):
+            report(progress, *(poll() if poll else (0, 0)))
+    except Cancelled:
+        proc.terminate()
+        proc.join()
+        raise
+
+    error = parent_conn.recv() if parent_conn.poll() else RuntimeError(f"Process exited with {proc.exitcode}")
+    proc.join()
+
+    if error is not None:
+        raise error
+
+
+def call_in_child(conn, target, args):
+    try:
+        target(*args)
+        conn.send(None)
+    except BaseException as e:
+        conn.send(e)
+
+
+def get_file_size(filepath):
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return 0
+
+
 def create_temp_folder():
     if not temp_folder.exists():
         os.makedirs(temp_folder)
 
 
-def get_iso_hash(isofile):
+def get_iso_hash(isofile, progress=None):
+    total = os.path.getsize(isofile)
+
     with open(isofile, "rb") as f:
+        advise(f.fileno(), 0, 0, "POSIX_FADV_SEQUENTIAL")
         file_hash = hashlib.md5()
-        while chunk := f.read(8192):
+        while chunk := f.read(get_chunk_size()):
             file_hash.update(chunk)
+            report(progress, f.tell(), total)
+
+        advise(f.fileno(), 0, 0, "POSIX_FADV_DONTNEED")
 
     return file_hash.hexdigest()
 
 
-def extract_data_bin(isofile):
+def copy_file(src, dest, progress=None):
+    total = os.path.getsize(src)
+
+    with open(src, "rb") as fin:
+        ranges = get_data_ranges(fin.fileno(), total)
+        advise(fin.fileno(), 0, 0, "POSIX_FADV_SEQUENTIAL")
+
+        with OutputFile(dest, total, ranges) as fout:
+            for offset, size in ranges:
+                fin.seek(offset)
+                fout.seek(offset)
+                while size > 0 and (chunk := fin.read(min(get_chunk_size(), size))):
+                    fout.write(chunk)
+                    size -= len(chunk)
+                    report(progress, fin.tell(), total)
+
+            fout.seek(total)
+
+        advise(fin.fileno(), 0, 0, "POSIX_FADV_DONTNEED")
+
+    shutil.copystat(src, dest)
+
+
+def extract_data_bin(isofile, progress=None):
     iso = pycdlib.PyCdlib()
     iso.open(isofile)
 
-    data_bin = BytesIO()
-    iso.get_file_from_iso_fp(data_bin, iso_path='/PSP_GAME/USRDIR/DATA.BIN')
+    # Streamed straight to disk
+    data_bin_path = Path(temp_folder, "DATA.BIN")
+    total = iso.get_record(iso_path='/PSP_GAME/USRDIR/DATA.BIN').get_data_length()
+    with OutputFile(data_bin_path, total) as f:
+        writer = ProgressWriter(f, total, progress or (lambda done, total: None))
+        iso.get_file_from_iso_fp(writer, blocksize=get_chunk_size(), iso_path='/PSP_GAME/USRDIR/DATA.BIN')
 
     iso.close()
 
-    data_bin_path = Path(temp_folder, "DATA.BIN")
-    with open(data_bin_path, "wb") as f:
-        f.write(data_bin.getbuffer())
-
     return str(data_bin_path)
 
 
-def write_config(barray, offset, data):
-    offset = int(offset, 16)
-    data = bytes.fromhex(data[2:])
-    dsize = len(data)
+def get_iso_file_extent(isofile, iso_path):
+    iso = pycdlib.PyCdlib()
+    iso.open(isofile)
+
+    try:
+        record = iso.get_record(iso_path=iso_path)
+        return record.extent_location() * ISO_BLOCK_SIZE, record.get_data_length()
+    finally:
+        iso.close()
+
+
+def copy_file_range(src, dest, offset, size, progress=None):
+    # Lets the kernel copy the range (reflink or server side copy when
+    # supported), plain reads and writes otherwise
+    use_kernel = hasattr(os, "copy_file_range")
+
+    with open(src, "rb") as fin, open(dest, "wb", buffering=0) as fout:
+        preallocate(fout.fileno(), 0, size)
+        done = 0
+        while done < size:
+            count = min(get_chunk_size(), size - done)
+
+            if use_kernel:
+                try:
+                    copied = os.copy_file_range(fin.fileno(), fout.fileno(), count, offset + done)
+                except OSError:
+                    use_kernel = False
+                    continue
+            else:
+                fin.seek(offset + done)
+                copied = fout.write(fin.read(count))
+
+            if copied == 0:
+                raise OSError(f"{src} ends before {offset + size}")
 
+            done += copied
+            report(progress, done, size)
+
+
+def copy_iso_file(isofile, iso_path, dest, progress=None):
+    # Copies the file's extent directly, the image is only parsed for the
+    # directory record
+    offset, size = get_iso_file_extent(isofile, iso_path)
+    copy_file_range(isofile, dest, offset, size, progress)
+
+
+def compile_config_schema(entries):
+    schema = []
+    for itm in entries:
+        values = tuple(bytes.fromhex(v["data"][2:]) for v in itm["options"]["values"])
+
+        index = {}
+        for i, v in enumerate(values):
+            index.setdefault(v, i)
+
+        schema.append(ConfigOption(int(itm["options"]["offset"], 16), len(values[0]), values, index))
+
+    return schema
+
+
+def write_bytes_at(barray, offset, data):
     # Expand file if the offset is bigger
     if len(barray) < offset + len(data):
         ext = (offset + len(data)) - len(barray)
         barray.extend(b'\x00' * ext)
 
-    for i in range(dsize):
-        barray[offset + i] = data[i]
+    barray[offset:offset + len(data)] = data
+
+
+def write_configs(barray, selections, schema=None):
+    for op, i in zip(schema or config_schema, selections):
+        if i is not None:
+            write_bytes_at(barray, op.offset, op.values[i])
 
     return barray
 
 
+def read_config_values(configbin, schema=None):
+    # 0 when the current value is not in the json options
+    return [op.index.get(bytes(configbin[op.offset:op.offset + op.size]), 0) for op in schema or config_schema]
+
+
 def read_configs(config_path):
-    configbin = read_file_bytes(config_path)
-    values = []
+    return read_config_values(read_file_bytes(config_path))
 
-    for itm in config["CONFIG.BIN"]:
-        offset = int(itm["options"]["offset"], 16)
-        jvalues = [bytes.fromhex(i["data"][2:]) for i in itm["options"]["values"]]
 
-        op_size = len(bytes.fromhex(itm["options"]["values"][0]["data"][2:]))
-        file_value = bytes(configbin[offset:offset+op_size])
+def apply_config_file(path, selections, schema=None):
+    ops = [(op, op.values[i]) for op, i in zip(schema or config_schema, selections) if i is not None]
+    if not ops:
+        return False
 
-        if file_value in jvalues:
-            index = None
-            for i, v in enumerate(itm["options"]["values"]):
-                if bytes.fromhex(v["data"][2:]) == file_value:
-                    index = i
-                    break
+    with open(path, "r+b") as f:
+        # Expand file if the offset is bigger
+        size = max(op.offset + len(data) for op, data in ops)
+        if os.fstat(f.fileno()).st_size < size:
+            f.truncate(size)
 
-            values.append(index)
-        else:
-            values.append(0)  # current value is not in the json options
+        changed = False
+        with mmap.mmap(f.fileno(), 0) as mm:
+            for op, data in ops:
+                if mm[op.offset:op.offset + len(data)] != data:
+                    mm[op.offset:op.offset + len(data)] = data
+                    changed = True
+
+            if changed:
+                mm.flush()
+
+    return changed
+
+
+def apply_configs(jobs, schema=None):
+    # jobs is an iterable of (CONFIG.BIN path, option indexes), None leaves an option untouched.
+    # Returns a {"path", "changed", "error"} result per job, in order
+    jobs = list(jobs)
+    paths = [path for path, _ in jobs]
+    selections = [sel for _, sel in jobs]
+
+    with ThreadPoolExecutor() as pool:
+        return list(pool.map(apply_config_job, paths, selections, [schema] * len(paths)))
+
+
+def apply_config_job(path, selections, schema=None):
+    # A file that can't be written doesn't stop the others
+    try:
+        return {"path": path, "changed": apply_config_file(path, selections, schema), "error": None}
+    except OSError as e:
+        return {"path": path, "changed": False, "error": e}
+
+
+def get_preset_selections(preset):
+    entries = config["CONFIG.BIN"]
+    descriptions = [itm["description"] for itm in entries]
+
+    selections = [None] * len(entries)
+    for desc, label in preset.items():
+        if desc not in descriptions:
+            raise ValueError(f"Unknown option in preset: {desc}")
+
+        i = descriptions.index(desc)
+        labels = [v["label"] for v in entries[i]["options"]["values"]]
+        if label not in labels:
+            raise ValueError(f"Unknown value for {desc}: {label}")
 
-    return values
+        selections[i] = labels.index(label)
+
+    return selections
+
+
+def is_mod_file(name):
+    return "." in name and not name.startswith(".")
+
+
+def iter_all_files(folderpath):
+    for root, dirs, files in os.walk(folderpath):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+
+        for name in files:
+            if is_mod_file(name):
+                yield os.path.join(root, name)
 
 
 def get_all_files(folderpath):
-    return glob.glob(f"{folderpath}/**/*.*", recursive=True)
+    return list(iter_all_files(folderpath))
 
 
-def read_replace_folder(infolder):
-    infiles = get_all_files(infolder)
+def get_replace_entry(f):
+    idx = find_file_id(f)
+    if idx is None:
+        return None  # File is not in the csv
 
-    existing_files = []
+    return {"path": filelist["ids"][idx], "id": idx, "file": str(f)}
 
-    for f in infiles:
-        key = Path(f).relative_to(infolder).name
-        try:
-            idx = filelist[key][0]
-            full_path = filelist[key][1]
-            existing_files.append({"path": full_path, "id": idx})
-        except KeyError:
-            continue  # File is not in the csv
 
+def find_file_id(f):
+    # The longest end of the path that is a full game path wins, so files in
+    # subfolders map to the right ID. The bare file name is the fallback,
+    # only when a single game file has it
+    parts = Path(f).parts
+    for i in range(max(len(parts) - filelist["depth"], 0), len(parts) - 1):
+        idx = filelist["paths"].get("/".join(parts[i:]))
+        if idx is not None:
+            return idx
+
+    ids = filelist["names"].get(parts[-1], [])
+    return ids[0] if len(ids) == 1 else None
+
+
+def iter_replace_folder(infolder, batch_size=256):
+    batch = []
+    for f in iter_all_files(infolder):
+        entry = get_replace_entry(f)
+        if entry is None:
+            continue
+
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def read_replace_folder(infolder):
+    existing_files = [f for batch in iter_replace_folder(infolder) for f in batch]
     existing_files.sort(key=lambda k: k['id'])
 
     return existing_files
 
 
-def generate_filebin(infolder, outfolder):
-    infiles = get_all_files(infolder)
+def generate_filebin(inputs, outfolder, base=None):
+    # inputs is a mods folder, a mod pack or an ordered list of them, later
+    # ones win over earlier ones. base is the dumped DATA.BIN folder delta
+    # packs are rebuilt from. Returns the conflicts that were resolved
+    if isinstance(inputs, (str, os.PathLike)):
+        inputs = [inputs]
 
-    file_ids = []
-    existing_files = []
-    for fi in infiles:
-        try:
-            key = Path(fi).relative_to(infolder).name
-            idx = filelist[key][0]
-            file_ids.append(idx)
-            existing_files.append({"path": fi, "id": idx})
-        except KeyError:
-            continue  # File is not in the csv
+    sources = []
+    try:
+        for source in inputs:
+            if modpack.is_pack(source):
+                pack = modpack.ModPack(source)
+                sources.append((str(source), pack, list(pack.entries)))
+            else:
+                files = {entry["id"]: entry["file"] for entry in read_replace_folder(source)}
+                sources.append((str(source), files, list(files)))
+
+        # Priority index, file ID to the position of the source that wins it
+        winners = {}
+        for priority, (_, _, ids) in enumerate(sources):
+            for idx in ids:
+                winners[idx] = priority
+
+        newbin = bitstring.BitArray(uint=0, length=826 * 8)
+
+        for f in winners:
+            idx = int(f)
+            block = int(idx / 8)
+            offset = idx % 8
+            index = (block * 8) + (7 - offset)
+            newbin[index] = True
+
+        if not os.path.isdir(outfolder):
+            os.mkdir(outfolder)
+
+        # copy/rename files and save FILE.BIN
+        with open(Path(outfolder, "FILE.BIN"), "wb") as f:
+            newbin.tofile(f)
+
+        # One pass over every source in its own order, packs are read front to back
+        for priority, (_, source, ids) in enumerate(sources):
+            for idx in ids:
+                if winners[idx] != priority:
+                    continue
+
+                if isinstance(source, modpack.ModPack):
+                    copy_pack_entry(source, idx, Path(outfolder, idx), base)
+                else:
+                    copy_with_size_header(source[idx], Path(outfolder, idx))
+    finally:
+        for _, source, _ in sources:
+            if isinstance(source, modpack.ModPack):
+                source.close()
+
+    return get_filebin_conflicts(sources, winners)
+
+
+def get_filebin_conflicts(sources, winners):
+    providers = {}
+    for name, _, ids in sources:
+        for idx in ids:
+            providers.setdefault(idx, []).append(name)
+
+    paths = filelist["ids"]
+    conflicts = []
+    for idx in sorted(providers):
+        if len(providers[idx]) > 1:
+            conflicts.append({
+                "id": idx,
+                "path": paths.get(idx, ""),
+                "winner": sources[winners[idx]][0],
+                "overridden": providers[idx][:-1],
+            })
+
+    return conflicts
+
+
+def build_mod_pack(infolder, outpath, codec=modpack.CODEC_NONE, progress=None, base=None):
+    # base is a dumped DATA.BIN folder, files found in it are stored as deltas
+    files = [(entry["id"], entry["file"]) for entry in read_replace_folder(infolder)]
+    bases = get_base_files(base, [idx for idx, _ in files]) if base else None
+    modpack.write_pack(files, outpath, codec, progress, bases, get_chunk_size())
+
+    return len(files)
+
+
+def get_base_files(base, ids):
+    bases = {}
+    for idx in ids:
+        path = Path(base, filelist["ids"][idx])
+        if path.is_file():
+            bases[idx] = path
+
+    return bases
+
+
+def copy_pack_entry(pack, idx, dest, base=None):
+    with open(dest, "wb") as fout:
+        fout.write(pack.get_size(idx).to_bytes(4, byteorder='little'))
+        pack.write_to(idx, fout, Path(base, filelist["ids"][idx]) if base else None, get_chunk_size())
+
+
+def copy_with_size_header(src, dest):
+    # Streamed, the file is never held in memory as a whole
+    with open(src, "rb") as fin, open(dest, "wb") as fout:
+        fout.write(os.fstat(fin.fileno()).st_size.to_bytes(4, byteorder='little'))
+        shutil.copyfileobj(fin, fout, get_chunk_size())
+
+
+def get_file_digest(path):
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(get_chunk_size()):
+            file_hash.update(chunk)
 
-    newbin = bitstring.BitArray(uint=0, length=826 * 8)
+    return file_hash.hexdigest()
 
-    for f in file_ids:
-        idx = int(f)
-        block = int(idx / 8)
-        offset = idx % 8
-        index = (block * 8) + (7 - offset)
-        newbin[index] = True
 
-    if not os.path.isdir(outfolder):
-        os.mkdir(outfolder)
+def read_sync_cache(folder):
+    try:
+        with open(Path(folder, SYNC_CACHE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    # copy/rename files and save FILE.BIN
-    with open(Path(outfolder, "FILE.BIN"), "wb") as f:
-        newbin.tofile(f)
 
-    copy_files(existing_files, outfolder)
+def write_sync_cache(folder, cache):
+    part_path = Path(folder, SYNC_CACHE_NAME + ".part")
+    with open(part_path, "w") as f:
+        json.dump(cache, f)
 
+    os.replace(part_path, Path(folder, SYNC_CACHE_NAME))
 
-def copy_files(allfiles, outfolder):
-    for f in allfiles:
-        nbytes = add_size_header(Path(f['path']))
-        write_file_bytes(Path(outfolder, f['id']), nbytes)
 
+def is_synced(path, entry, digest):
+    # A file that was resized on the stick since the last sync doesn't match
+    # its entry. mtime isn't compared, FAT only keeps it to 2 seconds and
+    # in local time, so it shifts with the timezone
+    if entry is None or entry["digest"] != digest:
+        return False
+
+    try:
+        return os.path.getsize(path) == entry["size"]
+    except OSError:
+        return False
+
+
+def sync_file(src, dest, digest):
+    # Copied next to it first, the game never sees a half written file
+    part_path = Path(dest.parent, f".{dest.name}.part")
+    try:
+        shutil.copyfile(src, part_path)
+        os.replace(part_path, dest)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+    return {"size": os.path.getsize(dest), "digest": digest}
 
-def add_size_header(path):
-    fbytes = read_file_bytes(path)
-    size = len(fbytes).to_bytes(4, byteorder='little')
 
-    return size + fbytes
+def sync_nativepsp(infolder, outfolder, progress=None):
+    # Brings a NATIVEPSP folder on the memory stick up to date with a
+    # generated one. Only changed files are copied, then FILE.BIN is
+    # replaced and only then files of IDs that are gone are deleted, so it
+    # never lists a file that isn't there
+    infolder = Path(infolder)
+    outfolder = Path(outfolder)
+    os.makedirs(outfolder, exist_ok=True)
 
+    ids = sorted(f.name for f in infolder.iterdir() if f.name in filelist["ids"])
+    cache = read_sync_cache(outfolder)
+    workers = get_max_workers(get_chunk_size(), SYNC_WORKERS)
 
-def rename_dump_files(outfolder):
+    with ThreadPoolExecutor(workers) as pool:
+        digests = dict(zip(ids, pool.map(get_file_digest, [Path(infolder, idx) for idx in ids])))
+
+    changed = [idx for idx in ids if not is_synced(Path(outfolder, idx), cache.get(idx), digests[idx])]
+    stale = sorted(f.name for f in outfolder.iterdir() if f.name in filelist["ids"] and f.name not in digests)
+
+    try:
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {pool.submit(sync_file, Path(infolder, idx), Path(outfolder, idx), digests[idx]): idx
+                       for idx in changed}
+            try:
+                for i, future in enumerate(as_completed(futures)):
+                    cache[futures[future]] = future.result()
+                    report(progress, i + 1, len(changed))
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+
+        filebin = Path(infolder, "FILE.BIN")
+        if filebin.is_file() and not is_same_file_content(filebin, Path(outfolder, "FILE.BIN")):
+            part_path = Path(outfolder, ".FILE.BIN.part")
+            shutil.copyfile(filebin, part_path)
+            os.replace(part_path, Path(outfolder, "FILE.BIN"))
+
+        for idx in stale:
+            os.remove(Path(outfolder, idx))
+    finally:
+        # Whatever was copied is kept, even when cancelled
+        write_sync_cache(outfolder, {idx: entry for idx, entry in cache.items() if idx in digests})
+
+    return {"copied": len(changed), "deleted": len(stale), "unchanged": len(ids) - len(changed)}
+
+
+def is_same_file_content(a, b):
+    try:
+        return read_file_bytes(a) == read_file_bytes(b)
+    except OSError:
+        return False
+
+
+def rename_dump_files(outfolder, progress=None):
     allfiles = glob.glob(f"{outfolder}/*", recursive=True)
-    inv_filelist = dict((v[0], v[1]) for k, v in filelist.items())
+    inv_filelist = filelist["ids"]
 
-    for f in allfiles:
+    for i, f in enumerate(allfiles):
+        report(progress, i, len(allfiles))
         npath = inv_filelist[Path(f).name]
         new_folders = Path(outfolder).joinpath(Path(npath).parent)
         os.makedirs(new_folders, exist_ok=True)
@@ -192,16 +824,40 @@ def rename_dump_files(outfolder):
         shutil.move(f, dest)
 
 
-def decrypt_data_bin(data_bin, outpath):
+def decrypt_data_bin(data_bin, outpath, progress=None):
+    # mhef doesn't report progress, the output size is used instead
+    total = os.path.getsize(data_bin)
+    run_in_process(decrypt_data_bin_file, (str(data_bin), str(outpath)), progress,
+                   lambda: (get_file_size(outpath), total))
+
+
+def decrypt_data_bin_file(data_bin, outpath):
     dc = mhef.psp.DataCipher(mhef.psp.MHP2G_JP)
     dc.decrypt_file(data_bin, outpath)
 
 
-def dump_data_bin(data_bin, outfolder):
-    mhff.psp.data.extract(data_bin, outfolder)
+def dump_data_bin(data_bin, outfolder, progress=None):
+    total = len(filelist["ids"])
+    run_in_process(mhff.psp.data.extract, (str(data_bin), str(outfolder)), progress,
+                   lambda: (min(len(os.listdir(outfolder)), total), total))
 
 
-def decrypt_save(filepath, region):
+def dump_data_bin_folder(data_bin, progress=None):
+    outfolder = Path(data_bin).parent.joinpath("data_root")
+
+    # Check if folder exists already, can cause issues later
+    if outfolder.exists():
+        shutil.rmtree(outfolder)
+
+    os.makedirs(outfolder, exist_ok=True)
+
+    dump_data_bin(data_bin, outfolder, progress)
+    rename_dump_files(outfolder, progress)
+
+    return str(outfolder.absolute())
+
+
+def get_save_game(region):
     game = None
 
     if region == 1:
@@ -211,28 +867,28 @@ def decrypt_save(filepath, region):
     if region == 3:
         game = mhef.psp.MHP2G_JP
 
-    sfile = read_file_bytes(filepath)
+    return game
+
+
+@lru_cache(maxsize=None)
+def get_save_ciphers(region):
+    game = get_save_game(region)
+
+    return mhef.psp.PSPSavedataCipher(game), mhef.psp.SavedataCipher(game)
 
-    psc = mhef.psp.PSPSavedataCipher(game)
-    sfile = psc.decrypt(sfile)
 
-    sc = mhef.psp.SavedataCipher(game)
+def decrypt_save(filepath, region):
+    psc, sc = get_save_ciphers(region)
+
+    sfile = read_file_bytes(filepath)
+    sfile = psc.decrypt(sfile)
     dec = sc.decrypt(sfile)
 
     return dec
 
 
 def encrypt_save(save, region):
-    game = None
-
-    if region == 1:
-        game = mhef.psp.MHP2G_EU
-    if region == 2:
-        game = mhef.psp.MHP2G_NA
-    if region == 3:
-        game = mhef.psp.MHP2G_JP
-
-    sc = mhef.psp.SavedataCipher(game)
+    _, sc = get_save_ciphers(region)
     enc = sc.encrypt(save)
 
     return enc
@@ -243,9 +899,9 @@ def get_quest_data(qfile):
     if qfile[0x00:0x08] != bytearray(b"\x4C\x00\x00\x00\x32\x4E\x44\x47"):
         return None, None
 
-    current = 0x80
-    while qfile[current] != 0x00:
-        current += 1
+    current = qfile.find(b"\x00", 0x80)
+    if current == -1:
+        raise ValueError("Quest name is not null terminated")
 
     name = qfile[0x80:current].decode("utf-8")
     qid = int.from_bytes(qfile[0x64:0x66], byteorder='little')
@@ -253,113 +909,149 @@ def get_quest_data(qfile):
     return str(qid), name
 
 
-def get_quests_in_folder():
-    quests = glob.glob("quests/*.mib*")+glob.glob("quests/*.pat")
+def get_quest_header_size(path):
+    # .pat quests have a 4 byte size header
+    return 0x04 if Path(path).suffix == ".pat" else 0x00
 
-    res = []
-    for q in quests:
-        if Path(q).suffix == ".pat":
-            qfile = read_file_bytes(q)[0x04:]
-        else:
-            qfile = read_file_bytes(q)
 
-        qid, name = get_quest_data(qfile)
-        if qid is not None:  # Ignore encrypted quests
-            if not qid.startswith("61"):  # Ignore arena/challenge quests
-                res.append({"bytes": qfile, "qid": qid, "name": name})
+def read_quest_file(path):
+    return read_file_bytes(path)[get_quest_header_size(path):]
 
-    res = sorted(res, key=lambda d: d['qid'])
-    return res
+
+def read_quest_info(path):
+    header = read_file_range(path, get_quest_header_size(path), QUEST_HEADER_SIZE)
+
+    try:
+        return get_quest_data(header)
+    except ValueError:
+        # Name doesn't fit in the header, fall back to the whole file
+        return get_quest_data(read_quest_file(path))
+
+
+def get_quest_digest(qfile):
+    return hashlib.blake2b(qfile, digest_size=16).hexdigest()
+
+
+def get_quest_file_digest(path):
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        f.seek(get_quest_header_size(path))
+        while chunk := f.read(get_chunk_size()):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def get_quest_slot(save_file, slot):
+    start = QUESTS_START + slot * QUESTS_SIZE
+    end = save_file.find(b'\x00\x00\x00\x00', start)
+
+    if end - start > 0:  # Check for empty slots
+        dec = decrypt_quest(save_file[start:end])
+
+        if len(dec) > 0:
+            qid, name = get_quest_data(dec)
+            return {"bytes": bytearray(dec), "qid": qid, "name": name}
+
+    return None
 
 
 def get_quests_in_save(save_file):
     res = []
-    for i in range(QUESTS_START, QUESTS_END, QUESTS_SIZE):
-        current = i
-        while save_file[current:current + 0x4] != b'\x00\x00\x00\x00':
-            current += 1
+    for i in range(QUESTS_SLOTS):
+        quest = get_quest_slot(save_file, i)
+        if quest is not None:
+            res.append(quest)
 
-        if current - i > 0:  # Check for empty slots
-            dec = decrypt_quest(save_file[i:current])
+    return res
 
-            if len(dec) > 0:
-                qid, name = get_quest_data(dec)
-                res.append({"bytes": bytearray(dec), "qid": qid, "name": name})
 
-    return res
+@lru_cache(maxsize=None)
+def get_quest_cipher(game):
+    return mhef.psp.QuestCipher(game)
 
 
 def encrypt_quest(quest):
     enc = bytes(bytearray(32))
 
     if len(quest) > 0:
-        qc = mhef.psp.QuestCipher(mhef.psp.MHP2G_JP)
+        qc = get_quest_cipher(mhef.psp.MHP2G_JP)
         enc = qc.encrypt(quest)
 
     return enc
 
 
 def decrypt_quest(quest):
-    # Very ugly but, yeah...
+    for game in QUEST_GAMES:
+        try:
+            return get_quest_cipher(game).decrypt(quest)
+        except ValueError:
+            continue  # Wrong region
+
+    return bytes()
+
+
+def get_decrypted_quest_path(path):
+    path = Path(path)
+    return path.with_name(path.name + ".dec")
+
+
+def decrypt_quest_file(path):
     try:
-        qc = mhef.psp.QuestCipher(mhef.psp.MHP2G_JP)
-        dec = qc.decrypt(quest)
-        return dec
-    except ValueError:
-        pass
+        dec = decrypt_quest(read_quest_file(path))
+    except OSError:
+        return None  # Deleted or unreadable, reported like a quest that doesn't decrypt
+
+    if len(dec) == 0:
+        return None
 
+    outpath = get_decrypted_quest_path(path)
+    # Quests can be hardlinked to their duplicates, see QuestIndex.dedupe
     try:
-        qc = mhef.psp.QuestCipher(mhef.psp.MHP2G_NA)
-        dec = qc.decrypt(quest)
-        return dec
-    except ValueError:
-        pass
+        replace_file_bytes(outpath, dec)
+    except OSError:
+        return None
+
+    return str(outpath)
+
 
+def decrypt_quest_files(paths, progress=None):
+    # Returns the decrypted path for each quest, None if it couldn't be decrypted
+    # Worker processes are the biggest cost on low memory devices
+    pool = ProcessPoolExecutor(get_max_workers(QUEST_WORKER_SIZE))
+    cancelled = False
     try:
-        qc = mhef.psp.QuestCipher(mhef.psp.MHP2G_EU)
-        dec = qc.decrypt(quest)
-        return dec
-    except ValueError:
-        pass
+        res = []
+        for dec in pool.map(decrypt_quest_file, paths, chunksize=16):
+            res.append(dec)
+            report(progress, len(res), len(paths))
+    except Cancelled:
+        cancelled = True
+        raise
+    finally:
+        pool.shutdown(wait=not cancelled, cancel_futures=True)
 
-    return bytes()
+    return res
 
 
-def add_quests_to_save(save, quests):
-    offsets = []
-    for i in range(QUESTS_START, QUESTS_END, QUESTS_SIZE):
-        offsets.append(i)
+def write_quest_slot(save, slot, quest):
+    offset = QUESTS_START + slot * QUESTS_SIZE
 
-    for i, q in enumerate(quests):
-        # Quest data
-        qenc = encrypt_quest(q["bytes"])
-        qsize = len(qenc)
-
-        for j in range(qsize):
-            save[offsets[i]+j] = qenc[j]
-
-        # Padding
-        padding = (offsets[i] + QUESTS_SIZE) - (offsets[i] + qsize)
-        for j in range(padding):
-            save[offsets[i]+qsize+j] = 0x00
-
-        if q['qid']:
-            # Quest filename
-            fname = f"m{q['qid']}.mib"
-            nsize = len(fname)
-            fname = fname.encode()
-        else:
-            nsize = 0
-            fname = ""
+    # Quest data, padded to the slot size
+    qenc = bytes(encrypt_quest(quest["bytes"])).ljust(QUESTS_SIZE, b"\x00")
+    save[offset:offset + len(qenc)] = qenc
+
+    # Quest filename
+    fname = f"m{quest['qid']}.mib".encode() if quest['qid'] else b""
+    noff = offset + QUESTS_SIZE - 0x10
+    save[noff:noff + 0x10] = fname + bytes(0x10 - len(fname))
 
-        noff = offsets[i] + QUESTS_SIZE - 0x10
-        for j in range(nsize):
-            save[noff+j] = fname[j]
+    return offset, offset + QUESTS_SIZE
 
-        # Padding
-        padding = 0x10 - nsize
-        for j in range(padding):
-            save[noff+nsize+j] = 0x00
+
+def add_quests_to_save(save, quests):
+    for i, q in enumerate(quests):
+        write_quest_slot(save, i, q)
 
     return save
 
@@ -372,16 +1064,26 @@ def get_config_json(filename):
 
 
 def get_filelist(filename):
-    nfilelist = {}
+    # Full path and ID lookups, the names index lists every ID sharing a file name
+    nfilelist = {"paths": {}, "ids": {}, "names": {}, "depth": 0}
     with open(filename) as f:
         reader = csv.reader(f)
         for idx, path in reader:
-            fname = Path(path).name
-            nfilelist.setdefault(fname, [idx, path])    # 0 = ID, 1 = full path
+            nfilelist["paths"][path] = idx
+            nfilelist["ids"][idx] = path
+            nfilelist["names"].setdefault(Path(path).name, []).append(idx)
+            nfilelist["depth"] = max(nfilelist["depth"], len(Path(path).parts))
 
     return nfilelist
 
 
+def get_exe_path(name):
+    if is_linux():
+        return Path(bin_path, name)
+    else:
+        return Path(bin_path, name + ".exe")
+
+
 def is_linux() -> bool:
     return sys.platform.startswith('linux')
 
@@ -400,5 +1102,10 @@ else:
 
 resources_path = Path(current_path, "res")
 temp_folder = resources_path.joinpath("temp")
+quests_path = Path(current_path, "quests")
+quest_index_path = resources_path.joinpath("quests.db")
 config = get_config_json(resources_path.joinpath("config.json"))
+config_schema = compile_config_schema(config["CONFIG.BIN"])
+memory_budget = get_memory_budget_env()
 filelist = get_filelist(resources_path.joinpath("filelist.csv"))
+modpack.xdelta_path = str(get_exe_path("xdelta3"))
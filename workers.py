@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from PyQt5 import QtCore
+
+import profiling
+import utils
+
+
+class JobSignals(QtCore.QObject):
+    progressSignal = QtCore.pyqtSignal(object, object, str)
+    endSignal = QtCore.pyqtSignal(object)
+    errorSignal = QtCore.pyqtSignal(object)
+    cancelSignal = QtCore.pyqtSignal()
+
+
+class Job(QtCore.QRunnable):
+    # Runs fn(*args, progress=callback) on the global thread pool,
+    # the callback raises utils.Cancelled once cancel() was called
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+        self.signals = JobSignals()
+        self.cancel_event = threading.Event()
+        self.started = None
+        self.last_report = 0
+        self.unit = None  # None for bytes
+
+    def start(self):
+        QtCore.QThreadPool.globalInstance().start(self)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def progress(self, done, total):
+        if self.cancel_event.is_set():
+            raise utils.Cancelled()
+
+        # Don't flood the GUI thread
+        now = time.monotonic()
+        if now - self.last_report < 0.1 and done != total:
+            return
+
+        self.last_report = now
+        self.signals.progressSignal.emit(done, total, format_progress(done, total, now - self.started, self.unit))
+
+    def run(self):
+        self.started = time.monotonic()
+
+        try:
+            with profiling.stage(getattr(self.fn, "__name__", "job")):
+                res = self.fn(*self.args, progress=self.progress, **self.kwargs)
+        except utils.Cancelled:
+            self.signals.cancelSignal.emit()
+            return
+        except Exception as e:
+            self.signals.errorSignal.emit(e)
+            return
+
+        self.signals.endSignal.emit(res)
+
+
+def format_size(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} GB"
+
+
+def format_progress(done, total, elapsed, unit=None):
+    if total <= 0:
+        return ""
+
+    text = f"{done * 100 // total}%"
+    if elapsed > 0 and done > 0:
+        rate = done / elapsed
+        eta = int((total - done) / rate)
+        speed = format_size(rate) if unit is None else f"{rate:.0f} {unit}"
+        text += f" | {speed}/s | ETA {eta // 60}:{eta % 60:02d}"
+
+    return text